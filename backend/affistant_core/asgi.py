@@ -3,6 +3,9 @@ ASGI config for affistant_core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+API は WSGI (runserver) で配信し、この ASGI アプリケーションは進捗ストリーム (SSE) 専用の
+events サービス (daphne) からのみ使用する。
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
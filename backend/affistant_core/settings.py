@@ -127,6 +127,10 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "static/"
+
+# エクスポートファイルなどの保存先
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Default primary key field type
@@ -134,8 +138,54 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-CELERY_BROKER_URL = env("REDIS_URL")
-CELERY_RESULT_BACKEND = env("REDIS_URL")
+REDIS_URL = env("REDIS_URL")
+
+# ワーカー間で共有するキャッシュ (ASPルールのバージョン管理など)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "affistant",
+    }
+}
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
+
+# ワークロードごとにキューを分け、docker-compose の専用ワーカーで処理する
+#   serp   ... Google API 呼び出し (APIクォータに合わせて低並列)
+#   scrape ... 記事スクレイピング (I/O待ちが主体のため高並列)
+#   ingest ... DBへの取り込み・配信
+#   export ... Excelエクスポート (長時間かかるため他の処理と分離)
+# 上記以外 (beat から実行される定期タスク等) は default キューで処理する
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_ROUTES = {
+    "tracking.tasks.enqueue_extraction_for_keyword": {"queue": "serp"},
+    "tracking.tasks.scrape_search_results": {"queue": "scrape"},
+    "tracking.tasks.complete_keyword_fetch": {"queue": "ingest"},
+    "tracking.tasks.fail_keyword_fetch": {"queue": "ingest"},
+    "tracking.tasks.deliver_keyword_fetch": {"queue": "ingest"},
+    "tracking.tasks.build_excel_export": {"queue": "export"},
+}
+# 長時間のタスクを1プロセスが抱え込まないよう先読みは最小にし、キューごとの値は各ワーカーの --prefetch-multiplier で指定する
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    # 実行日時を過ぎた定期スケジュールの抽出を開始する
+    "dispatch-due-extraction-schedules": {
+        "task": "tracking.tasks.dispatch_due_schedules",
+        "schedule": 60.0,
+    },
+    # リーダーのタスクが失われて終わらない KeywordFetch を失敗として確定し、待機中の実行へ配信する
+    "fail-stale-keyword-fetches": {
+        "task": "tracking.tasks.fail_stale_keyword_fetches",
+        "schedule": 5.0 * 60,
+    },
+    # 時間枠を過ぎた KeywordFetch (案件横断で共有する取得結果) を削除する
+    "purge-keyword-fetches": {
+        "task": "tracking.tasks.purge_keyword_fetches",
+        "schedule": 60.0 * 60,
+    },
+}
 
 # === DRF (Django REST Framework) の設定 ===
 REST_FRAMEWORK = {
@@ -162,6 +212,58 @@ SPECTACULAR_SETTINGS = {
 # Djangoに対して、このモデルを認証に使用するように指示
 AUTH_USER_MODEL = "users.User"
 
+# 検索結果の取得元 (テスト・開発時は tracking.serp.FixtureSerpProvider で SERP_FIXTURE_PATH の JSON を返す)
+SERP_PROVIDER = env("SERP_PROVIDER", default="tracking.serp.GoogleCSEProvider")
+SERP_FIXTURE_PATH = env("SERP_FIXTURE_PATH", default="")
+
 # Google Custom Search API
 GOOGLE_CSE_API_KEY = env("GOOGLE_CSE_API_KEY", default="")
 GOOGLE_CSE_ID = env("GOOGLE_CSE_ID", default="")
+SERP_CACHE_TTL = env.int("SERP_CACHE_TTL", default=6 * 60 * 60)  # SERPレスポンスのキャッシュ秒数
+GOOGLE_CSE_RATE = env.float("GOOGLE_CSE_RATE", default=2)  # 全ワーカー合計のAPIリクエスト数/秒
+# 待たずに連続で送るリクエスト数。未指定の場合は1検索に必要なページ数 (ceil(max_rank / 10)) を使う
+GOOGLE_CSE_BURST = env.int("GOOGLE_CSE_BURST", default=None)
+
+# ワーカーごとに共有する HTTP クライアントの接続プール
+HTTP_MAX_CONNECTIONS = env.int("HTTP_MAX_CONNECTIONS", default=100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int("HTTP_MAX_KEEPALIVE_CONNECTIONS", default=50)
+HTTP_KEEPALIVE_EXPIRY = env.float("HTTP_KEEPALIVE_EXPIRY", default=30)  # アイドル接続を保持する秒数
+
+# 記事スクレイピング (並行取得)
+SCRAPE_MAX_CONCURRENCY = env.int("SCRAPE_MAX_CONCURRENCY", default=20)  # ワーカー全体の同時接続数
+SCRAPE_PER_HOST_CONCURRENCY = env.int("SCRAPE_PER_HOST_CONCURRENCY", default=2)  # 同一ホストへの同時接続数
+SCRAPE_HOST_RATE = env.float("SCRAPE_HOST_RATE", default=1.0)  # 全ワーカー合計の同一ホストへのリクエスト数/秒
+SCRAPE_HOST_BURST = env.int("SCRAPE_HOST_BURST", default=1)
+SCRAPE_TIMEOUT = env.float("SCRAPE_TIMEOUT", default=15)  # タイムアウトの上限 (実際の値はホストのレイテンシから決める)
+SCRAPE_MIN_TIMEOUT = env.float("SCRAPE_MIN_TIMEOUT", default=3)
+SCRAPE_TIMEOUT_P95_FACTOR = env.float("SCRAPE_TIMEOUT_P95_FACTOR", default=3)  # タイムアウト = p95レイテンシ × この倍率
+SCRAPE_MAX_BYTES = env.int("SCRAPE_MAX_BYTES", default=2 * 1024 * 1024)  # 1ページあたりの最大読み込みバイト数
+PAGE_CACHE_TTL = env.int("PAGE_CACHE_TTL", default=12 * 60 * 60)  # この秒数以内に取得したページは再検証せずに再利用
+SCRAPE_BATCH_SIZE = env.int("SCRAPE_BATCH_SIZE", default=5)  # 1サブタスクあたりの記事URL数
+
+# 同じ実行内で記事URLの取得を1回にまとめる登録簿 (single-flight)
+RUN_FETCH_REGISTRY_TTL = env.int("RUN_FETCH_REGISTRY_TTL", default=6 * 60 * 60)  # 取得結果を共有する秒数
+RUN_FETCH_CLAIM_TTL = env.int("RUN_FETCH_CLAIM_TTL", default=2 * 60)  # 取得中の印の有効期限 (取得タスクの停止に備える)
+RUN_FETCH_WAIT_TIMEOUT = env.float("RUN_FETCH_WAIT_TIMEOUT", default=60)  # 他のタスクの取得結果を待つ最大秒数
+RUN_FETCH_POLL_INTERVAL = env.float("RUN_FETCH_POLL_INTERVAL", default=0.5)
+
+# ホストごとのサーキットブレーカー (全ワーカー共通)
+HOST_HEALTH_WINDOW = env.int("HOST_HEALTH_WINDOW", default=50)  # 失敗率・レイテンシの算出に使う直近のリクエスト数
+HOST_HEALTH_MIN_SAMPLES = env.int("HOST_HEALTH_MIN_SAMPLES", default=5)
+HOST_HEALTH_TTL = env.int("HOST_HEALTH_TTL", default=24 * 60 * 60)  # アクセスの無いホストの記録を破棄するまでの秒数
+HOST_FAILURE_THRESHOLD = env.float("HOST_FAILURE_THRESHOLD", default=0.5)  # この失敗率以上でサーキットを open にする
+HOST_CIRCUIT_COOLDOWN = env.int("HOST_CIRCUIT_COOLDOWN", default=5 * 60)  # open にしてから再試行するまでの秒数
+
+# 同じキーワード (正規化済み) の取得を案件をまたいで共有する時間枠 (秒)。枠内では SERP・記事の取得を1回にまとめる
+KEYWORD_FETCH_WINDOW = env.int("KEYWORD_FETCH_WINDOW", default=6 * 60 * 60)
+# この秒数を過ぎても完了しない共有取得は、停止したものとみなして別のタスクが引き継ぐ
+KEYWORD_FETCH_TIMEOUT = env.int("KEYWORD_FETCH_TIMEOUT", default=30 * 60)
+
+# 進捗ストリーム (Server-Sent Events) でイベントが無い間に keepalive を送る間隔 (秒)
+RUN_EVENTS_KEEPALIVE = env.float("RUN_EVENTS_KEEPALIVE", default=15)
+# 進捗ストリームへの接続用チケットの有効期限 (秒)。接続時にだけ検証する
+RUN_EVENTS_TICKET_MAX_AGE = env.int("RUN_EVENTS_TICKET_MAX_AGE", default=60)
+# 抽出ジョブの進捗ハッシュ (Redis) の保持秒数 (更新のたびに延長される)
+RUN_PROGRESS_TTL = env.int("RUN_PROGRESS_TTL", default=7 * 24 * 60 * 60)
+# 進捗エンドポイントで認証済みトークンをキャッシュする秒数
+TOKEN_CACHE_TTL = env.int("TOKEN_CACHE_TTL", default=5 * 60)
@@ -1,5 +1,20 @@
 from django.contrib import admin
-from .models import Genre, Project, Keyword, MediaSite, ExtractionRun, SearchResult, AffiliateLink
+from .models import (
+    Genre,
+    Project,
+    Keyword,
+    MediaSite,
+    AspRule,
+    PageCache,
+    ExtractionRun,
+    ExtractionSchedule,
+    KeywordFetch,
+    SearchResult,
+    CanonicalLink,
+    AffiliateLink,
+    ExportJob,
+)
+from .scheduling import next_run_at
 
 # モデルの管理画面での表示をカスタマイズします
 
@@ -50,18 +65,88 @@ class MediaSiteAdmin(admin.ModelAdmin):
     search_fields = ("domain", "name")
 
 
+@admin.register(AspRule)
+class AspRuleAdmin(admin.ModelAdmin):
+    """
+    ASPルール モデルの管理画面設定
+    """
+
+    list_display = ("name", "host", "path_pattern", "is_active", "updated_at")
+    search_fields = ("name", "host")
+    list_filter = ("is_active",)
+    ordering = ("name", "host")
+
+
+@admin.register(PageCache)
+class PageCacheAdmin(admin.ModelAdmin):
+    """
+    記事ページキャッシュ モデルの管理画面設定
+    """
+
+    list_display = ("url", "etag", "last_modified", "fetched_at")
+    search_fields = ("url",)
+    ordering = ("-fetched_at",)
+
+
 @admin.register(ExtractionRun)
 class ExtractionRunAdmin(admin.ModelAdmin):
     """
     検索実行履歴 モデルの管理画面設定
     """
 
-    list_display = ("project", "executed_at", "max_rank", "status")
+    list_display = (
+        "project",
+        "executed_at",
+        "max_rank",
+        "status",
+        "total_keywords",
+        "succeeded_keywords",
+        "failed_keywords",
+        "serp_cache_hits",
+        "serp_cache_misses",
+    )
     list_filter = ("project__name", "status")
     date_hierarchy = "executed_at"
     ordering = ("-executed_at",)
 
 
+@admin.register(ExtractionSchedule)
+class ExtractionScheduleAdmin(admin.ModelAdmin):
+    """
+    定期実行スケジュール モデルの管理画面設定
+    """
+
+    list_display = (
+        "project",
+        "frequency",
+        "weekday",
+        "window_start",
+        "window_end",
+        "is_active",
+        "next_run_at",
+        "last_run",
+    )
+    list_filter = ("frequency", "is_active")
+    ordering = ("next_run_at",)
+    readonly_fields = ("next_run_at", "last_run")
+
+    def save_model(self, request, obj, form, change):
+        obj.next_run_at = next_run_at(obj) if obj.is_active else None
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(KeywordFetch)
+class KeywordFetchAdmin(admin.ModelAdmin):
+    """
+    案件横断の共有取得 モデルの管理画面設定
+    """
+
+    list_display = ("query", "max_rank", "window_start", "status", "succeeded", "started_at", "finished_at")
+    search_fields = ("query",)
+    list_filter = ("status",)
+    ordering = ("-started_at",)
+
+
 @admin.register(SearchResult)
 class SearchResultAdmin(admin.ModelAdmin):
     """
@@ -80,6 +165,28 @@ class AffiliateLinkAdmin(admin.ModelAdmin):
     アフィリエイトリンク モデルの管理画面設定
     """
 
-    list_display = ("link_url", "asp_name", "product_name", "search_result")
-    search_fields = ("link_url", "asp_name", "product_name")
+    list_display = ("link", "asp_name", "product_name", "search_result")
+    search_fields = ("link__url", "asp_name", "product_name")
     list_filter = ("asp_name",)
+    raw_id_fields = ("search_result", "link")
+
+
+@admin.register(CanonicalLink)
+class CanonicalLinkAdmin(admin.ModelAdmin):
+    """
+    正規化済みアフィリエイトリンク モデルの管理画面設定
+    """
+
+    list_display = ("url", "created_at")
+    search_fields = ("url", "url_hash")
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """
+    エクスポートジョブ モデルの管理画面設定
+    """
+
+    list_display = ("project", "run", "status", "created_at", "finished_at")
+    list_filter = ("status",)
+    ordering = ("-created_at",)
@@ -0,0 +1,114 @@
+import re
+import uuid
+from urllib.parse import urlparse
+
+from django.core.cache import cache
+
+from .models import AspRule, path_pattern_error
+
+# ルール変更時に更新されるバージョン。全ワーカーが共有キャッシュ経由で参照する
+RULES_VERSION_CACHE_KEY = "tracking:asp_rules_version"
+
+_cached_matcher = None
+_cached_version = None
+
+
+class AspMatcher:
+    """
+    AspRule をコンパイルしたリンク判定器。
+
+    ホスト名をラベル単位のサフィックス (px.a8.net -> a8.net -> net) で辞書引きし、
+    ホストごとのパスパターンは1つの正規表現にまとめる。
+    1リンクあたりの判定コストはASP数に依存しない。
+    """
+
+    def __init__(self, rules, version=None):
+        self.version = version
+        patterns_by_host = {}
+        for rule in rules:
+            host = rule.host.strip().lower().lstrip(".")
+            patterns_by_host.setdefault(host, []).append((rule.path_pattern, rule.name))
+
+        self._hosts = {}
+        for host, entries in patterns_by_host.items():
+            default_name = None
+            names = {}
+            alternatives = []
+            for path_pattern, name in entries:
+                if not path_pattern:
+                    default_name = name
+                    continue
+                error = path_pattern_error(path_pattern)
+                if error:
+                    # 不正なルールが1件あっても、他のルールでの判定は続ける
+                    print(f"Skipping invalid ASP rule ({name}, {host}): {error}")
+                    continue
+                group = f"r{len(alternatives)}"
+                names[group] = name
+                alternatives.append(f"(?P<{group}>{path_pattern})")
+            try:
+                path_regex = re.compile("|".join(alternatives)) if alternatives else None
+            except re.error as e:
+                print(f"Skipping path patterns for ASP host {host}: {e}")
+                path_regex = None
+            self._hosts[host] = (path_regex, names, default_name)
+
+    def _host_entries(self, parsed):
+        # ホスト名をラベル単位のサフィックスで辞書引きし、登録されているエントリを長い順に返す
+        labels = (parsed.hostname or "").split(".")
+        for i in range(len(labels)):
+            entry = self._hosts.get(".".join(labels[i:]))
+            if entry is not None:
+                yield entry
+
+    def matches_host(self, url):
+        """
+        URLのホストがいずれかのASPのホスト (またはそのサブドメイン) であれば True を返す
+        """
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return False
+        return any(True for _ in self._host_entries(parsed))
+
+    def match(self, url):
+        """
+        URLがいずれかのASPに該当すればASP名を、該当しなければ None を返す
+        """
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return None
+
+        for path_regex, names, default_name in self._host_entries(parsed):
+            if path_regex is not None:
+                path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+                m = path_regex.search(path)
+                if m:
+                    return names[m.lastgroup]
+            if default_name:
+                return default_name
+        return None
+
+
+def get_asp_matcher():
+    """
+    プロセス内にキャッシュした AspMatcher を返す。
+    ルールが変更されていれば (共有キャッシュのバージョンが変わっていれば) 再構築する。
+    """
+    global _cached_matcher, _cached_version
+
+    version = cache.get(RULES_VERSION_CACHE_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(RULES_VERSION_CACHE_KEY, version, timeout=None)
+        version = cache.get(RULES_VERSION_CACHE_KEY, version)
+
+    if _cached_matcher is None or version != _cached_version:
+        _cached_matcher = AspMatcher(AspRule.objects.filter(is_active=True), version=version)
+        _cached_version = version
+    return _cached_matcher
+
+
+def invalidate_asp_matcher():
+    cache.set(RULES_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
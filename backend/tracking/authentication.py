@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+def token_cache_key(key):
+    return f"tracking:auth_token:{key}"
+
+
+class CachedTokenUser:
+    """
+    キャッシュから復元した認証済みユーザー。ID と有効フラグのみを持ち、DBの User 行は読み込まない。
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, is_active):
+        self.id = self.pk = user_id
+        self.is_active = is_active
+
+    def __str__(self):
+        return f"user:{self.id}"
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    トークンに対応するユーザーの (ID, 有効フラグ) を Redis キャッシュに保持する TokenAuthentication。
+    高頻度にポーリングされるエンドポイントで、リクエストごとのDB参照を避けるために使う。
+    パスワードハッシュ等を共有キャッシュに載せないよう、User 行そのものはキャッシュしない。
+    トークン削除 (ログアウト) やユーザー更新時はシグナルでキャッシュを破棄する。
+    """
+
+    def authenticate_credentials(self, key):
+        cached = cache.get(token_cache_key(key))
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            cached = (user.id, user.is_active)
+            cache.set(token_cache_key(key), cached, timeout=settings.TOKEN_CACHE_TTL)
+
+        user_id, is_active = cached
+        if not is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return CachedTokenUser(user_id, is_active), key
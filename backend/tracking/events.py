@@ -0,0 +1,96 @@
+import json
+
+import redis.asyncio
+from django.conf import settings
+from django.core import signing
+
+from .models import ExtractionRun
+from .redis_client import get_redis
+
+# クライアントへ送る ExtractionRun の進捗フィールド
+RUN_SNAPSHOT_FIELDS = ["id", "status", "total_keywords", "succeeded_keywords", "failed_keywords"]
+
+
+# 進捗ストリームの接続用チケットの署名に使う salt
+EVENTS_TICKET_SALT = "tracking.run-events"
+
+
+def run_channel(run_id):
+    return f"tracking:run:{run_id}"
+
+
+def issue_events_ticket(user_id, run_id):
+    """
+    進捗ストリームへの接続に使う署名付きチケットを発行する。
+    EventSource はヘッダーを付けられずURLに認証情報を載せることになるため、
+    期限の無いAPIトークンの代わりに、1つの実行にだけ使える短期間のチケットを渡す。
+    """
+    return signing.dumps({"user": user_id, "run": run_id}, salt=EVENTS_TICKET_SALT)
+
+
+def verify_events_ticket(ticket, run_id):
+    """
+    チケットが run_id 用で期限内であればユーザーIDを、そうでなければ None を返す
+    """
+    try:
+        payload = signing.loads(ticket, salt=EVENTS_TICKET_SALT, max_age=settings.RUN_EVENTS_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if payload.get("run") != run_id:
+        return None
+    return payload.get("user")
+
+
+def publish_run_event(run_id, event_type, **payload):
+    """
+    ExtractionRun の現在の進捗を添えて、Redis pub/sub でイベントを配信し、配信した進捗を返す。
+    配信に失敗しても抽出処理自体は継続する (クライアントは再接続時のスナップショットで追いつく)。
+    """
+    snapshot = ExtractionRun.objects.filter(id=run_id).values(*RUN_SNAPSHOT_FIELDS).first()
+    if snapshot is None:
+        return None
+    message = json.dumps({"type": event_type, **snapshot, **payload})
+    try:
+        get_redis().publish(run_channel(run_id), message)
+    except Exception as e:
+        print(f"Run event publish failed (run={run_id}): {e}")
+    return snapshot
+
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_run_events(run_id):
+    """
+    ExtractionRun のイベントを Server-Sent Events 形式で yield する非同期ジェネレーター。
+    最初に現在の状態を送り、終了状態になった時点でストリームを閉じる。
+    """
+    client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(run_channel(run_id))
+
+        # 購読開始後にスナップショットを取ることで、その間に発生したイベントの取りこぼしを防ぐ
+        snapshot = await ExtractionRun.objects.filter(id=run_id).values(*RUN_SNAPSHOT_FIELDS).afirst()
+        if snapshot is None:
+            # 所有者チェックの後に実行履歴が削除された場合は、何も送らずに閉じる
+            return
+        yield format_sse("status", {"type": "status", **snapshot})
+        if snapshot["status"] not in ExtractionRun.ACTIVE_STATUSES:
+            return
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.RUN_EVENTS_KEEPALIVE)
+            if message is None:
+                # プロキシにアイドル接続として切断されないよう、定期的にコメント行を送る
+                yield ": keepalive\n\n"
+                continue
+
+            event = json.loads(message["data"])
+            yield format_sse(event["type"], event)
+            if event["status"] not in ExtractionRun.ACTIVE_STATUSES:
+                return
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,156 @@
+import csv
+import tempfile
+
+import openpyxl
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import ResultSummary
+
+EXPORT_HEADER = [
+    "検索日時",
+    "キーワード",
+    "メディア名",
+    "SEO順位",
+    "記事名",
+    "掲載記事リンク",
+    "メディア種類",
+    "提携ASP",
+] + [f"リンク{i+1}" for i in range(10)]
+
+# DBから一度に読み込む件数 / CSVを1チャンクとして送信する行数
+QUERY_CHUNK_SIZE = 2000
+CSV_ROWS_PER_CHUNK = 500
+
+
+def parse_export_filters(params):
+    """
+    クエリパラメータからエクスポート範囲を取り出す。不正な値の場合は ValueError を送出する。
+
+    run: 実行履歴ID または "latest" / date_from, date_to: YYYY-MM-DD / keywords: カンマ区切りのキーワード
+    """
+    filters = {}
+
+    run = params.get("run")
+    if run:
+        if run != "latest" and not run.isdigit():
+            raise ValueError("run には実行履歴ID または latest を指定してください。")
+        filters["run"] = run
+
+    for name in ("date_from", "date_to"):
+        value = params.get(name)
+        if value:
+            if parse_date(value) is None:
+                raise ValueError(f"{name} は YYYY-MM-DD 形式で指定してください。")
+            filters[name] = value
+
+    keywords = [k.strip() for k in params.get("keywords", "").split(",") if k.strip()]
+    if keywords:
+        filters["keywords"] = sorted(set(keywords))
+
+    return filters
+
+
+def filter_runs(project, filters):
+    """
+    エクスポート対象の実行履歴を新しい順に返す
+    """
+    runs = project.runs.order_by("-executed_at", "-id")
+    if filters.get("run") == "latest":
+        return runs[:1]
+    if filters.get("run"):
+        runs = runs.filter(id=filters["run"])
+    if filters.get("date_from"):
+        runs = runs.filter(executed_at__date__gte=parse_date(filters["date_from"]))
+    if filters.get("date_to"):
+        runs = runs.filter(executed_at__date__lte=parse_date(filters["date_to"]))
+    return runs
+
+
+def iter_rows(project, filters=None):
+    """
+    エクスポート用のデータ行を1行ずつ生成する。
+
+    非正規化済みの ResultSummary のみを読み、実行履歴ごとに (keyword_text, rank) の
+    キーセットページネーションで (run, keyword_text, rank) インデックスを順に辿る。
+    1回の実行分のエクスポートはその実行の件数に比例した時間で終わり、メモリ使用量も一定に保たれる。
+    """
+    filters = filters or {}
+    columns = ("keyword_text", "display_domain", "rank", "title", "page_url", "media_type", "asp_list", "link_urls")
+
+    for run_id, executed_at in filter_runs(project, filters).values_list("id", "executed_at"):
+        executed_at_str = timezone.localtime(executed_at).strftime("%Y-%m-%d %H:%M")
+        base = ResultSummary.objects.filter(run_id=run_id)
+        if filters.get("keywords"):
+            base = base.filter(keyword_text__in=filters["keywords"])
+
+        last = None
+        while True:
+            page = base
+            if last is not None:
+                page = page.filter(Q(keyword_text__gt=last[0]) | Q(keyword_text=last[0], rank__gt=last[1]))
+            chunk = list(page.order_by("keyword_text", "rank").values_list(*columns)[:QUERY_CHUNK_SIZE])
+
+            for keyword_text, domain, rank, title, page_url, media_type, asp_list, link_urls in chunk:
+                yield [
+                    executed_at_str,  # A: 検索日時
+                    keyword_text,  # B: キーワード
+                    domain,  # C: メディア名(トップドメイン)
+                    rank if rank > 0 else "取得失敗",  # D: SEO順位
+                    title,  # E: 記事名
+                    page_url,  # F: 掲載記事リンク
+                    media_type,  # G: メディア種類
+                    asp_list,  # H: 提携ASP
+                    *link_urls,  # リンク列 (トップ10まで)
+                    *[""] * (10 - len(link_urls)),
+                ]
+
+            if len(chunk) < QUERY_CHUNK_SIZE:
+                break
+            last = (chunk[-1][0], chunk[-1][2])
+
+
+class _Echo:
+    """
+    csv.writer の書き込み先として、書き込まれた文字列をそのまま返す疑似バッファ
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(project, filters=None):
+    """
+    CSVを数百行ごとの文字列チャンクとして生成する (StreamingHttpResponse 用)
+    """
+    writer = csv.writer(_Echo())
+    # Excelで文字化けしないよう先頭にBOMを付与
+    yield "\ufeff" + writer.writerow(EXPORT_HEADER)
+
+    lines = []
+    for row in iter_rows(project, filters):
+        lines.append(writer.writerow(row))
+        if len(lines) >= CSV_ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def write_excel(project, job):
+    """
+    openpyxl の write-only モードでExcelファイルを生成し、job.file に保存する。
+    行はストリームとして書き出されるため、セルオブジェクトがメモリに残らない。
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("SEO Results")
+    ws.append(EXPORT_HEADER)
+    for row in iter_rows(project, job.filters):
+        ws.append(row)
+
+    with tempfile.NamedTemporaryFile(suffix=".xlsx") as tmp:
+        wb.save(tmp.name)
+        with open(tmp.name, "rb") as f:
+            job.file.save(f"{project.id}/seo_results_{job.id}.xlsx", File(f), save=False)
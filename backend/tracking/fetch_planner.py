@@ -0,0 +1,112 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import KeywordFetch, KeywordFetchSubscription
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text):
+    """
+    全角/半角・大文字/小文字・空白の違いを吸収したクエリ文字列を返す
+    """
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+def current_window(now=None):
+    """
+    現在時刻が属する時間枠 (KEYWORD_FETCH_WINDOW 秒単位) の開始日時を返す
+    """
+    now = now or timezone.now()
+    window = settings.KEYWORD_FETCH_WINDOW
+    return datetime.fromtimestamp(int(now.timestamp()) // window * window, tz=dt_timezone.utc)
+
+
+def _is_stale(fetch):
+    # リーダーのワーカーが停止した場合に備え、一定時間終わらない取得は別のタスクが引き継ぐ
+    return fetch.started_at < timezone.now() - timedelta(seconds=settings.KEYWORD_FETCH_TIMEOUT)
+
+
+def subscribe(run, keyword):
+    """
+    (run, keyword) を時間枠内の KeywordFetch に登録し、(fetch, subscription, role) を返す。
+
+    role:
+      "leader"   ... 呼び出し側が取得を行い、完了後に complete() で全購読者へ配信する
+      "follower" ... 別のタスクが取得中のため、完了時に配信されるのを待つ
+      "ready"    ... 時間枠内の取得が既に完了しているため、すぐに配信できる
+    """
+    query = normalize_query(keyword.text)
+    if run.force_refresh:
+        # SERP再取得の指定時は、既存の取得結果を使わず単独で取得する
+        fetch = KeywordFetch.objects.create(query=query, max_rank=run.max_rank, window_start=None)
+        subscription = KeywordFetchSubscription.objects.create(fetch=fetch, run=run, keyword=keyword)
+        return fetch, subscription, "leader"
+
+    with transaction.atomic():
+        # 同じ時間枠の行を同時に作成しようとした場合、get_or_create は作成済みの行を取得し直す
+        fetch, created = KeywordFetch.objects.select_for_update().get_or_create(
+            query=query, max_rank=run.max_rank, window_start=current_window()
+        )
+        subscription, _ = KeywordFetchSubscription.objects.get_or_create(fetch=fetch, run=run, keyword=keyword)
+
+        if created:
+            role = "leader"
+        elif fetch.status == "completed":
+            role = "ready"
+        elif fetch.status == "failed" or _is_stale(fetch):
+            # 失敗・停止した取得はこのタスクがリーダーとして取り直す
+            fetch.status = "running"
+            fetch.started_at = timezone.now()
+            fetch.save(update_fields=["status", "started_at"])
+            role = "leader"
+        else:
+            role = "follower"
+    return fetch, subscription, role
+
+
+def complete(fetch_id, serp_results, links_by_rank, scrape_statuses, hit_count=0, succeeded=True):
+    """
+    取得結果を保存し、未配信の購読IDのリストを返す。
+    行ロック中に状態を completed にするため、この後に登録した購読者は subscribe() で "ready" を受け取る。
+    """
+    with transaction.atomic():
+        fetch = KeywordFetch.objects.select_for_update().get(id=fetch_id)
+        fetch.status = "completed"
+        fetch.succeeded = succeeded
+        fetch.serp_results = serp_results
+        fetch.links_by_rank = links_by_rank
+        fetch.scrape_statuses = scrape_statuses
+        fetch.hit_count = hit_count
+        fetch.finished_at = timezone.now()
+        fetch.save()
+        return list(fetch.subscriptions.filter(delivered=False).values_list("id", flat=True))
+
+
+def stale_fetch_ids():
+    """
+    KEYWORD_FETCH_TIMEOUT 秒を過ぎても終わっていない取得のIDを返す
+    """
+    threshold = timezone.now() - timedelta(seconds=settings.KEYWORD_FETCH_TIMEOUT)
+    return list(KeywordFetch.objects.filter(status="running", started_at__lt=threshold).values_list("id", flat=True))
+
+
+def fail(fetch_id, stale_only=False):
+    """
+    取得を失敗として確定し、未配信の購読IDのリストを返す。
+    stale_only=True の場合は、行ロック下でまだ running のまま期限切れであることを確認し、
+    その間に完了・引き継ぎされていれば何もせず None を返す。
+    """
+    with transaction.atomic():
+        fetch = KeywordFetch.objects.select_for_update().get(id=fetch_id)
+        if stale_only and (fetch.status != "running" or not _is_stale(fetch)):
+            return None
+        fetch.status = "failed"
+        fetch.finished_at = timezone.now()
+        fetch.save(update_fields=["status", "finished_at"])
+        return list(fetch.subscriptions.filter(delivered=False).values_list("id", flat=True))
@@ -0,0 +1,99 @@
+import asyncio
+import math
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+# 取得失敗を表すサンプル値 (成功時はレイテンシのミリ秒を記録する)
+FAILURE = -1
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[math.ceil(len(ordered) * 0.95) - 1]
+
+
+class HostHealth:
+    """
+    ホストごとの直近の取得結果 (レイテンシ/失敗) を Redis 上で全ワーカー共通に記録するサーキットブレーカー。
+
+    - closed    ... 通常状態。p95 レイテンシからタイムアウトを決める
+    - open      ... 失敗率が閾値を超えたホスト。HOST_CIRCUIT_COOLDOWN 秒間は取得せずにスキップする
+    - half-open ... クールダウン後、1リクエストだけ試行 (プローブ) し、成功すれば closed に戻す
+    """
+
+    def __init__(self, host):
+        prefix = f"hosthealth:{host}"
+        self.samples_key = f"{prefix}:samples"
+        self.open_key = f"{prefix}:open"
+        self.probe_key = f"{prefix}:probe"
+        self._probing = False
+
+    def _is_unhealthy(self, samples):
+        if len(samples) < settings.HOST_HEALTH_MIN_SAMPLES:
+            return False
+        failures = sum(1 for sample in samples if sample == FAILURE)
+        return failures / len(samples) >= settings.HOST_FAILURE_THRESHOLD
+
+    def _timeout(self, samples, max_timeout):
+        latencies = [sample for sample in samples if sample != FAILURE]
+        if len(latencies) < settings.HOST_HEALTH_MIN_SAMPLES:
+            return max_timeout
+        timeout = _p95(latencies) / 1000 * settings.SCRAPE_TIMEOUT_P95_FACTOR
+        return min(max(timeout, settings.SCRAPE_MIN_TIMEOUT), max_timeout)
+
+    def permit(self, max_timeout):
+        """
+        取得してよければタイムアウト秒数を、サーキットが open のためスキップすべきなら None を返す
+        """
+        try:
+            redis = get_redis()
+            is_open, raw_samples = redis.pipeline().exists(self.open_key).lrange(self.samples_key, 0, -1).execute()
+            if is_open:
+                return None
+
+            samples = [int(sample) for sample in raw_samples]
+            if self._is_unhealthy(samples):
+                # half-open: 同時に1リクエストだけプローブとして通す
+                if not redis.set(self.probe_key, 1, nx=True, ex=math.ceil(max_timeout) + 5):
+                    return None
+                self._probing = True
+            return self._timeout(samples, max_timeout)
+        except Exception as e:
+            print(f"Host health unavailable ({self.samples_key}): {e}")
+            return max_timeout
+
+    def record(self, latency=None, failed=False):
+        """
+        1リクエスト分の結果を記録し、失敗率が閾値を超えた (またはプローブが失敗した) 場合はサーキットを open にする
+        """
+        sample = FAILURE if failed else int(latency * 1000)
+        try:
+            redis = get_redis()
+            if self._probing and not failed:
+                # プローブ成功: 過去の失敗を破棄して closed に戻す
+                pipe = redis.pipeline()
+                pipe.delete(self.samples_key, self.probe_key)
+                pipe.rpush(self.samples_key, sample)
+                pipe.expire(self.samples_key, settings.HOST_HEALTH_TTL)
+                pipe.execute()
+                return
+
+            pipe = redis.pipeline()
+            pipe.lpush(self.samples_key, sample)
+            pipe.ltrim(self.samples_key, 0, settings.HOST_HEALTH_WINDOW - 1)
+            pipe.expire(self.samples_key, settings.HOST_HEALTH_TTL)
+            pipe.lrange(self.samples_key, 0, -1)
+            samples = [int(s) for s in pipe.execute()[-1]]
+
+            if failed and (self._probing or self._is_unhealthy(samples)):
+                redis.pipeline().set(self.open_key, 1, ex=settings.HOST_CIRCUIT_COOLDOWN).delete(self.probe_key).execute()
+        except Exception as e:
+            print(f"Host health unavailable ({self.samples_key}): {e}")
+
+    async def permit_async(self, max_timeout):
+        return await asyncio.to_thread(self.permit, max_timeout)
+
+    async def record_async(self, latency=None, failed=False):
+        await asyncio.to_thread(self.record, latency, failed)
@@ -0,0 +1,67 @@
+import asyncio
+import atexit
+import os
+
+import httpx
+from django.conf import settings
+
+# ワーカープロセスごとに共有する HTTP クライアントとイベントループ。
+# 接続プールを使い回すことで、同じホストへの TCP/TLS 接続をタスクをまたいで keep-alive で再利用する。
+_pid = None
+_loop = None
+_async_client = None
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _check_pid():
+    # Celery の prefork ではフォーク前の接続を子プロセスで共有できないため、プロセスごとに作り直す
+    global _pid, _loop, _async_client
+    pid = os.getpid()
+    if _pid != pid:
+        _pid = pid
+        _loop = _async_client = None
+
+
+def get_async_client():
+    """
+    run_async() で実行中のコルーチンから使う共有 httpx.AsyncClient を返す
+    (gzip/deflate 等の圧縮転送はクライアントが自動でデコードする)
+    """
+    global _async_client
+    _check_pid()
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(limits=_limits(), follow_redirects=True)
+    return _async_client
+
+
+def run_async(coro):
+    """
+    プロセス内で使い回すイベントループでコルーチンを実行する。
+    asyncio.run() はループごとに閉じてしまい AsyncClient の接続を再利用できないため、ループを保持し続ける。
+    """
+    global _loop, _async_client
+    _check_pid()
+    if _loop is None or _loop.is_closed():
+        # AsyncClient の接続はループに紐づくため、ループを作り直した場合はクライアントも作り直す
+        _loop = asyncio.new_event_loop()
+        _async_client = None
+    return _loop.run_until_complete(coro)
+
+
+@atexit.register
+def close():
+    global _loop, _async_client
+    if _pid != os.getpid():
+        return
+    if _async_client is not None and _loop is not None and not _loop.is_closed():
+        _loop.run_until_complete(_async_client.aclose())
+    if _loop is not None:
+        _loop.close()
+    _loop = _async_client = None
@@ -0,0 +1,157 @@
+from urllib.parse import urlparse
+
+from django.db import transaction
+
+from .asp_matcher import get_asp_matcher
+from .links import link_hash, normalize_link_url, upsert_canonical_links
+from .models import AffiliateLink, Keyword, MediaSite, ResultSummary, SearchResult
+
+NOT_FOUND_DOMAIN = "not_found"
+SUMMARY_LINK_COUNT = 10
+
+
+def build_summary_fields(domain, links):
+    """
+    エクスポート列 (メディア名, メディア種類, 提携ASP, 上位リンク) を組み立てる
+    """
+    # メディア名: "www." を除去したトップドメイン
+    display_domain = domain[4:] if domain.startswith("www.") else domain
+    media_type = "アフィリエイトメディア" if links else "その他"
+    # 提携ASP一覧 (出現順に重複排除)
+    asp_list = ", ".join(dict.fromkeys(link["asp_name"] for link in links if link["asp_name"]))
+    link_urls = [link["link_url"] for link in links[:SUMMARY_LINK_COUNT]]
+    return {
+        "display_domain": display_domain,
+        "media_type": media_type,
+        "asp_list": asp_list[:1024],
+        "link_urls": link_urls,
+    }
+
+
+def canonicalize_links(links, matcher):
+    """
+    リンクのURLを正規化し、正規化後に同じURLになるリンクは最初の1件だけ残す
+    (キャッシュ済みのページなど、正規化前に抽出したリンクにも対応するため)
+    """
+    canonical = {}
+    for link in links:
+        url = normalize_link_url(link["link_url"], matcher)
+        canonical.setdefault(url, {**link, "link_url": url})
+    return list(canonical.values())
+
+
+@transaction.atomic
+def ingest_keyword_results(run, keyword_id, serp_results, links_by_rank, hit_count=0, scrape_statuses=None):
+    """
+    1キーワード分の検索結果・アフィリエイトリンク・エクスポート用サマリーを1トランザクションで一括保存する。
+    既存のユニーク制約 (MediaSite.domain / SearchResult の run, keyword, rank) に対する
+    バルクアップサートを使うため、DBの往復回数は結果件数に依存しない。
+
+    serp_results: [{"rank", "title", "url"}, ...] (空の場合は「検索結果なし」の行を保存)
+    links_by_rank: {rank: [{"asp_name", "link_url", "product_name"}, ...]}
+    scrape_statuses: {rank: "ok" / "failed" / "skipped"} (記載の無い順位は "ok")
+    """
+    scrape_statuses = scrape_statuses or {}
+    matcher = get_asp_matcher()
+    links_by_rank = {rank: canonicalize_links(links, matcher) for rank, links in links_by_rank.items()}
+    if hit_count:
+        Keyword.objects.filter(id=keyword_id).update(search_volume=hit_count)
+    keyword_text = Keyword.objects.values_list("text", flat=True).get(id=keyword_id)
+
+    if not serp_results:
+        dummy_site, _ = MediaSite.objects.get_or_create(domain=NOT_FOUND_DOMAIN, defaults={"name": "検索結果なし"})
+        search_result, _ = SearchResult.objects.update_or_create(
+            run=run,
+            keyword_id=keyword_id,
+            rank=0,
+            defaults={"media_site": dummy_site, "page_url": "", "title": "検索結果なし (API)"},
+        )
+        ResultSummary.objects.update_or_create(
+            search_result=search_result,
+            defaults={
+                "run": run,
+                "keyword_text": keyword_text,
+                "rank": 0,
+                "title": search_result.title,
+                "page_url": "",
+                **build_summary_fields(NOT_FOUND_DOMAIN, []),
+            },
+        )
+        return
+
+    # メディアサイト: 未登録のドメインのみ挿入し、IDをまとめて取得
+    domain_by_rank = {data["rank"]: urlparse(data["url"]).netloc for data in serp_results}
+    domains = set(domain_by_rank.values())
+    # 並行して同じドメインを挿入するトランザクション同士でロック順序が揃うよう、ドメイン順に挿入する
+    MediaSite.objects.bulk_create(
+        [MediaSite(domain=domain, name=domain) for domain in sorted(domains)], ignore_conflicts=True
+    )
+    site_ids = dict(MediaSite.objects.filter(domain__in=domains).values_list("domain", "id"))
+
+    # 検索結果: (run, keyword, rank) でアップサート
+    SearchResult.objects.bulk_create(
+        [
+            SearchResult(
+                run=run,
+                keyword_id=keyword_id,
+                rank=data["rank"],
+                media_site_id=site_ids[domain_by_rank[data["rank"]]],
+                page_url=data["url"],
+                title=(data["title"] or "")[:512],
+                scrape_status=scrape_statuses.get(data["rank"], "ok"),
+            )
+            for data in serp_results
+        ],
+        update_conflicts=True,
+        unique_fields=["run", "keyword", "rank"],
+        update_fields=["media_site", "page_url", "title", "scrape_status"],
+    )
+    result_ids = dict(
+        SearchResult.objects.filter(run=run, keyword_id=keyword_id, rank__in=domain_by_rank).values_list("rank", "id")
+    )
+
+    # アフィリエイトリンク: 正規化したURLを CanonicalLink に登録し、対象記事の既存の対応付けを置き換える
+    link_ids = upsert_canonical_links(aff_data["link_url"] for links in links_by_rank.values() for aff_data in links)
+    scraped_ids = [result_ids[rank] for rank in links_by_rank]
+    AffiliateLink.objects.filter(search_result_id__in=scraped_ids).delete()
+    AffiliateLink.objects.bulk_create(
+        [
+            AffiliateLink(
+                search_result_id=result_ids[rank],
+                link_id=link_ids[link_hash(aff_data["link_url"])],
+                asp_name=aff_data["asp_name"],
+                product_name=aff_data["product_name"],
+            )
+            for rank, links in links_by_rank.items()
+            for aff_data in links
+        ]
+    )
+
+    # エクスポート用サマリー
+    ResultSummary.objects.bulk_create(
+        [
+            ResultSummary(
+                search_result_id=result_ids[data["rank"]],
+                run=run,
+                keyword_text=keyword_text,
+                rank=data["rank"],
+                title=(data["title"] or "")[:512],
+                page_url=data["url"],
+                **build_summary_fields(domain_by_rank[data["rank"]], links_by_rank.get(data["rank"], [])),
+            )
+            for data in serp_results
+        ],
+        update_conflicts=True,
+        unique_fields=["search_result"],
+        update_fields=[
+            "run",
+            "keyword_text",
+            "rank",
+            "title",
+            "page_url",
+            "display_domain",
+            "media_type",
+            "asp_list",
+            "link_urls",
+        ],
+    )
@@ -0,0 +1,165 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+from charset_normalizer import from_bytes
+
+# 文字コード判定のために先読みするバイト数 (metaタグは通常この範囲に含まれる)
+SNIFF_BYTES = 4096
+
+_HEADER_CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+# ブラウザと同様に、互換性のある上位の文字コードでデコードする
+_ENCODING_ALIASES = {
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "sjis": "cp932",
+    "x-sjis": "cp932",
+    "windows-31j": "cp932",
+    "euc-jp": "euc_jis_2004",
+    "iso-8859-1": "cp1252",
+}
+
+
+def detect_encoding(content_type, head):
+    """
+    Content-Type ヘッダー → BOM → metaタグ の順に文字コードを判定する。
+    いずれにも無い場合のみ、先頭バイトに対して文字コード推定を行う。
+    """
+    candidates = []
+    if content_type:
+        m = _HEADER_CHARSET_RE.search(content_type)
+        if m:
+            candidates.append(m.group(1))
+    if head.startswith(codecs.BOM_UTF8):
+        candidates.append("utf-8-sig")
+    m = _META_CHARSET_RE.search(head)
+    if m:
+        candidates.append(m.group(1).decode("ascii", errors="ignore"))
+
+    for name in candidates:
+        name = _ENCODING_ALIASES.get(name.lower(), name)
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+
+    best = from_bytes(head).best() if head else None
+    return best.encoding if best else "utf-8"
+
+
+class AnchorParser(HTMLParser):
+    """
+    <a href> とその中のテキスト / img の alt のみを収集するインクリメンタルパーサー。
+    DOMツリーを構築しないため、メモリ使用量はページサイズに依存しない。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors = []
+        self._href = None
+        self._texts = []
+        self._img_alt = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._close_anchor()
+            href = dict(attrs).get("href")
+            if href:
+                self._href = href.strip()
+                self._texts = []
+                self._img_alt = None
+        elif tag == "img" and self._href is not None and self._img_alt is None:
+            alt = dict(attrs).get("alt")
+            if alt:
+                self._img_alt = alt
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._close_anchor()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            stripped = data.strip()
+            if stripped:
+                self._texts.append(stripped)
+
+    def _close_anchor(self):
+        if self._href is not None:
+            self.anchors.append((self._href, "".join(self._texts), self._img_alt))
+            self._href = None
+
+    def close(self, truncated=False):
+        if truncated:
+            # 途中で切れた本文の未解析部分と閉じていない <a> は不完全なため、テキストとして扱わずに捨てる
+            self.rawdata = ""
+            self._href = None
+        super().close()
+        self._close_anchor()
+
+
+class StreamingLinkExtractor:
+    """
+    レスポンス本文をチャンク単位で受け取り、(href, テキスト, img alt) を返すリンク抽出器。
+    max_bytes に達した時点で以降の入力は読み捨てる (exhausted が True になる)。
+    """
+
+    def __init__(self, content_type=None, max_bytes=None):
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.exhausted = False
+        self.encoding = None
+
+        self._head = b""
+        self._decoder = None
+        self._parser = AnchorParser()
+
+    def feed(self, chunk):
+        if self.exhausted:
+            return []
+        if self.max_bytes is not None and self.received + len(chunk) >= self.max_bytes:
+            chunk = chunk[: self.max_bytes - self.received]
+            self.exhausted = True
+        self.received += len(chunk)
+
+        if self._decoder is None:
+            # 文字コード判定用に先頭を溜めてからデコードを開始する
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES and not self.exhausted:
+                return []
+            chunk, self._head = self._head, b""
+            self._start_decoder(chunk)
+
+        self._parser.feed(self._decoder.decode(chunk))
+        return self._drain()
+
+    def close(self):
+        if self._decoder is None:
+            chunk, self._head = self._head, b""
+            self._start_decoder(chunk)
+            self._parser.feed(self._decoder.decode(chunk))
+        self._parser.feed(self._decoder.decode(b"", final=True))
+        self._parser.close(truncated=self.exhausted)
+        return self._drain()
+
+    def _start_decoder(self, head):
+        self.encoding = detect_encoding(self.content_type, head)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+
+    def _drain(self):
+        anchors, self._parser.anchors = self._parser.anchors, []
+        return anchors
+
+
+def iter_anchors(chunks, content_type=None, max_bytes=None):
+    """
+    バイト列のイテラブルから (href, テキスト, img alt) を順に yield する
+    """
+    extractor = StreamingLinkExtractor(content_type=content_type, max_bytes=max_bytes)
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+        if extractor.exhausted:
+            break
+    yield from extractor.close()
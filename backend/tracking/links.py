@@ -0,0 +1,81 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .models import CanonicalLink
+
+# リンク先を変えずに広告・解析ツールが付与するクエリパラメータ (どのホストでも除く)
+_TRACKING_PARAMS = {
+    "gclid",
+    "dclid",
+    "fbclid",
+    "yclid",
+    "msclkid",
+    "twclid",
+    "ttclid",
+    "_ga",
+    "_gl",
+}
+_TRACKING_PREFIXES = ("utm_", "mc_")
+# セッション用のパラメータ。sid 等の汎用的な名前は ASP の識別子としても使われるため、ASP以外のホストでのみ除く
+_SESSION_PARAMS = {"sid", "sessionid", "session_id", "phpsessid", "jsessionid"}
+_PATH_SESSION_RE = re.compile(r";jsessionid=[^/?#]*", re.IGNORECASE)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _is_stripped(name, strip_tracking, strip_session):
+    name = name.lower()
+    if strip_tracking and (name in _TRACKING_PARAMS or name.startswith(_TRACKING_PREFIXES)):
+        return True
+    return strip_session and name in _SESSION_PARAMS
+
+
+def normalize_url(url, strip_tracking=False, strip_session=False):
+    """
+    同じリンク先を指すURLを同一視するため、スキーム・ホストを小文字にし、既定ポートとフラグメントを除く。
+    strip_tracking=True の場合は広告・解析用のパラメータを、strip_session=True の場合はセッション用のパラメータも除く
+    (残りのパラメータの順序は保持する)
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path, query = parts.path, parts.query
+    if strip_session:
+        path = _PATH_SESSION_RE.sub("", path)
+    if strip_tracking or strip_session:
+        params = parse_qsl(query, keep_blank_values=True)
+        kept = [(k, v) for k, v in params if not _is_stripped(k, strip_tracking, strip_session)]
+        # 除くパラメータが無ければ、エンコードの違いを生まないよう元のクエリ文字列をそのまま使う
+        if len(kept) != len(params):
+            query = urlencode(kept)
+    return urlunsplit((scheme, host, path or "/", query, ""))
+
+
+def normalize_link_url(url, matcher):
+    """
+    アフィリエイトリンクのURLを正規化する。広告・解析用のパラメータは常に除くが、
+    ASPのホストではセッション用に見える名前 (sid 等) も成果の計測に使われるため残す。
+    """
+    return normalize_url(url, strip_tracking=True, strip_session=not matcher.matches_host(url))
+
+
+def link_hash(normalized_url):
+    return hashlib.sha256(normalized_url.encode("utf-8")).hexdigest()
+
+
+def upsert_canonical_links(normalized_urls):
+    """
+    正規化済みのURLのうち CanonicalLink に未登録の分だけ挿入し、{URLハッシュ: CanonicalLink.id} を返す
+    """
+    canonical = {link_hash(url): url for url in normalized_urls}
+    if not canonical:
+        return {}
+
+    # 並行して同じリンクを挿入するタスク同士でロック順序が揃うよう、ハッシュ順に挿入する
+    CanonicalLink.objects.bulk_create(
+        [CanonicalLink(url_hash=url_hash, url=canonical[url_hash][:2048]) for url_hash in sorted(canonical)],
+        ignore_conflicts=True,
+    )
+    return dict(CanonicalLink.objects.filter(url_hash__in=canonical).values_list("url_hash", "id"))
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from tracking.links import link_hash
+from tracking.models import AffiliateLink, CanonicalLink, ExtractionRun, Keyword, MediaSite, Project, SearchResult
+from tracking.renderers import ORJSONRenderer
+from tracking.serializers import (
+    SEARCH_RESULT_VALUE_FIELDS,
+    SearchResultSerializer,
+    serialize_search_results_fast,
+)
+from users.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "検索結果一覧の ModelSerializer 経路と高速読み取りパスの処理時間を比較する (データはロールバックされる)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--results", type=int, default=500, help="1ページあたりの検索結果件数")
+        parser.add_argument("--links", type=int, default=5, help="検索結果1件あたりのアフィリエイトリンク数")
+        parser.add_argument("--repeat", type=int, default=10, help="計測の繰り返し回数")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                run = self._create_fixture(options["results"], options["links"])
+                self._measure(run, options["repeat"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_fixture(self, result_count, link_count):
+        owner, _ = User.objects.get_or_create(email="benchmark@example.com")
+        project = Project.objects.create(name="benchmark", owner=owner)
+        keyword = Keyword.objects.create(project=project, text="benchmark")
+        run = ExtractionRun.objects.create(project=project, max_rank=result_count, status="completed")
+        site = MediaSite.objects.create(domain="benchmark.example.com")
+
+        results = SearchResult.objects.bulk_create(
+            SearchResult(
+                run=run,
+                keyword=keyword,
+                media_site=site,
+                rank=rank,
+                page_url=f"https://benchmark.example.com/{rank}",
+                title=f"記事タイトル {rank}",
+            )
+            for rank in range(1, result_count + 1)
+        )
+        links = CanonicalLink.objects.bulk_create(
+            CanonicalLink(url_hash=link_hash(url), url=url)
+            for url in (f"https://px.a8.net/benchmark/{i}" for i in range(link_count))
+        )
+        AffiliateLink.objects.bulk_create(
+            AffiliateLink(search_result=result, link=link, asp_name="A8.net", product_name=f"商品 {i}")
+            for result in results
+            for i, link in enumerate(links)
+        )
+        return run
+
+    def _measure(self, run, repeat):
+        queryset = SearchResult.objects.filter(run=run).order_by("-id")
+
+        def serializer_path():
+            data = SearchResultSerializer(queryset.prefetch_related("affiliate_links__link"), many=True).data
+            return JSONRenderer().render(data)
+
+        def fast_path():
+            data = serialize_search_results_fast(list(queryset.values(*SEARCH_RESULT_VALUE_FIELDS)))
+            return ORJSONRenderer().render(data)
+
+        timings = {}
+        for label, func in [("ModelSerializer + JSONRenderer", serializer_path), ("values() + ORJSONRenderer", fast_path)]:
+            func()  # ウォームアップ
+            started = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            timings[label] = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write(f"{label}: {timings[label]:.1f} ms/page")
+
+        slow, fast = timings.values()
+        self.stdout.write(self.style.SUCCESS(f"高速読み取りパスは {slow / fast:.1f} 倍高速"))
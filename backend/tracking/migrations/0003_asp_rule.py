@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_alter_searchresult_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AspRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='ASP名')),
+                ('host', models.CharField(help_text='例: a8.net (サブドメインも一致)', max_length=255, verbose_name='ホスト')),
+                ('path_pattern', models.CharField(blank=True, max_length=255, verbose_name='パスパターン(正規表現)')),
+                ('is_active', models.BooleanField(default=True, verbose_name='有効')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('host', 'path_pattern')},
+            },
+        ),
+    ]
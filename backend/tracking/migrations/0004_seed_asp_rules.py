@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# 従来の ASP_DOMAINS に相当する初期ルール (以降の追加・変更は管理画面から行う)
+INITIAL_ASP_RULES = [
+    ("A8", "a8.net"),
+    ("afb", "afi-b.com"),
+    ("afb", "affiliate-b.com"),
+    ("ValueCommerce", "valuecommerce.com"),
+    ("ValueCommerce", "valuecommerce.ne.jp"),
+    ("AccessTrade", "accesstrade.net"),
+    ("Rentracks", "rentracks.jp"),
+    ("Felmat", "felmat.net"),
+    ("もしも", "moshimo.com"),
+    ("MediPartner", "medipartner.jp"),
+    ("Zucks Affiliate", "zucks.net"),
+    ("JANet", "j-a-net.jp"),
+    ("アドトラック", "ad-track.jp"),
+    ("affitown", "affitown.jp"),
+    ("Presco", "presco.ai"),
+]
+
+
+def seed_asp_rules(apps, schema_editor):
+    AspRule = apps.get_model("tracking", "AspRule")
+    for name, host in INITIAL_ASP_RULES:
+        AspRule.objects.get_or_create(host=host, path_pattern="", defaults={"name": name})
+
+
+def unseed_asp_rules(apps, schema_editor):
+    AspRule = apps.get_model("tracking", "AspRule")
+    AspRule.objects.filter(host__in=[host for _, host in INITIAL_ASP_RULES], path_pattern="").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0003_asp_rule'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_asp_rules, unseed_asp_rules),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_seed_asp_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64, unique=True, verbose_name='URLハッシュ')),
+                ('url', models.URLField(max_length=2048, verbose_name='記事URL')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last-Modified')),
+                ('rules_version', models.CharField(blank=True, max_length=32, verbose_name='ASPルールバージョン')),
+                ('links', models.JSONField(default=list, verbose_name='抽出済みリンク')),
+                ('fetched_at', models.DateTimeField(verbose_name='最終取得日時')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_page_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionrun',
+            name='force_refresh',
+            field=models.BooleanField(default=False, verbose_name='SERP再取得'),
+        ),
+        migrations.AddField(
+            model_name='extractionrun',
+            name='serp_cache_hits',
+            field=models.IntegerField(default=0, verbose_name='SERPキャッシュヒット数'),
+        ),
+        migrations.AddField(
+            model_name='extractionrun',
+            name='serp_cache_misses',
+            field=models.IntegerField(default=0, verbose_name='SERPキャッシュミス数'),
+        ),
+    ]
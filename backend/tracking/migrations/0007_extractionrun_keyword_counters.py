@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_extractionrun_serp_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionrun',
+            name='failed_keywords',
+            field=models.IntegerField(default=0, verbose_name='失敗キーワード数'),
+        ),
+        migrations.AddField(
+            model_name='extractionrun',
+            name='succeeded_keywords',
+            field=models.IntegerField(default=0, verbose_name='成功キーワード数'),
+        ),
+        migrations.AddField(
+            model_name='extractionrun',
+            name='total_keywords',
+            field=models.IntegerField(default=0, verbose_name='キーワード数'),
+        ),
+        migrations.AlterField(
+            model_name='extractionrun',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('completed_with_errors', 'Completed with errors'), ('failed', 'Failed')], default='pending', max_length=32, verbose_name='Status'),
+        ),
+    ]
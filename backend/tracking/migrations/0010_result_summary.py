@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_exportjob_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSummary',
+            fields=[
+                ('search_result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='tracking.searchresult', verbose_name='検索結果記事')),
+                ('keyword_text', models.CharField(max_length=255, verbose_name='キーワード')),
+                ('display_domain', models.CharField(max_length=255, verbose_name='メディア名')),
+                ('rank', models.IntegerField(verbose_name='SEO順位')),
+                ('title', models.CharField(blank=True, max_length=512, verbose_name='記事タイトル')),
+                ('page_url', models.URLField(blank=True, max_length=2048, verbose_name='掲載記事リンク')),
+                ('media_type', models.CharField(max_length=32, verbose_name='メディア種類')),
+                ('asp_list', models.CharField(blank=True, max_length=1024, verbose_name='提携ASP')),
+                ('link_urls', models.JSONField(default=list, verbose_name='リンク (上位10件)')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='tracking.extractionrun', verbose_name='実行履歴')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'keyword_text', 'rank'], name='tracking_re_run_id_d74164_idx')],
+            },
+        ),
+    ]
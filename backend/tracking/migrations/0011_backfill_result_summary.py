@@ -0,0 +1,64 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_result_summary(apps, schema_editor):
+    SearchResult = apps.get_model("tracking", "SearchResult")
+    AffiliateLink = apps.get_model("tracking", "AffiliateLink")
+    ResultSummary = apps.get_model("tracking", "ResultSummary")
+
+    results = (
+        SearchResult.objects.filter(summary__isnull=True)
+        .select_related("keyword", "media_site")
+        .order_by("id")
+    )
+    batch = []
+    for result in results.iterator(chunk_size=BATCH_SIZE):
+        batch.append(result)
+        if len(batch) >= BATCH_SIZE:
+            _write_summaries(batch, AffiliateLink, ResultSummary)
+            batch = []
+    if batch:
+        _write_summaries(batch, AffiliateLink, ResultSummary)
+
+
+def _write_summaries(results, AffiliateLink, ResultSummary):
+    links_by_result = {}
+    for result_id, link_url, asp_name in (
+        AffiliateLink.objects.filter(search_result_id__in=[r.id for r in results])
+        .order_by("id")
+        .values_list("search_result_id", "link_url", "asp_name")
+    ):
+        links_by_result.setdefault(result_id, []).append((link_url, asp_name))
+
+    summaries = []
+    for result in results:
+        links = links_by_result.get(result.id, [])
+        domain = result.media_site.domain
+        summaries.append(
+            ResultSummary(
+                search_result_id=result.id,
+                run_id=result.run_id,
+                keyword_text=result.keyword.text,
+                display_domain=domain[4:] if domain.startswith("www.") else domain,
+                rank=result.rank,
+                title=result.title,
+                page_url=result.page_url,
+                media_type="アフィリエイトメディア" if links else "その他",
+                asp_list=", ".join(dict.fromkeys(asp for _, asp in links if asp))[:1024],
+                link_urls=[url for url, _ in links[:10]],
+            )
+        )
+    ResultSummary.objects.bulk_create(summaries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_result_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_result_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0011_backfill_result_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(choices=[('daily', '毎日'), ('weekly', '毎週')], default='daily', max_length=10, verbose_name='頻度')),
+                ('weekday', models.IntegerField(blank=True, choices=[(0, '月曜日'), (1, '火曜日'), (2, '水曜日'), (3, '木曜日'), (4, '金曜日'), (5, '土曜日'), (6, '日曜日')], null=True, verbose_name='曜日')),
+                ('window_start', models.TimeField(verbose_name='実行時間帯 (開始)')),
+                ('window_end', models.TimeField(verbose_name='実行時間帯 (終了)')),
+                ('max_rank', models.IntegerField(default=10, verbose_name='最大抽出順位')),
+                ('is_active', models.BooleanField(default=True, verbose_name='有効')),
+                ('next_run_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='次回実行日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tracking.extractionrun', verbose_name='前回の実行履歴')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='tracking.project', verbose_name='案件')),
+            ],
+        ),
+    ]
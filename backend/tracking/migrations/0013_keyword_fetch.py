@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_extraction_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordFetch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=255, verbose_name='検索クエリ (正規化済み)')),
+                ('max_rank', models.IntegerField(verbose_name='最大抽出順位')),
+                ('window_start', models.DateTimeField(blank=True, null=True, verbose_name='時間枠')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20, verbose_name='Status')),
+                ('succeeded', models.BooleanField(default=True, verbose_name='成功')),
+                ('serp_results', models.JSONField(blank=True, default=list, verbose_name='検索結果')),
+                ('links_by_rank', models.JSONField(blank=True, default=dict, verbose_name='順位ごとのリンク')),
+                ('hit_count', models.BigIntegerField(default=0, verbose_name='ヒット件数')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='取得開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+            ],
+            options={
+                'unique_together': {('query', 'max_rank', 'window_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KeywordFetchSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivered', models.BooleanField(default=False, verbose_name='配信済み')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fetch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='tracking.keywordfetch')),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fetch_subscriptions', to='tracking.keyword')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fetch_subscriptions', to='tracking.extractionrun')),
+            ],
+            options={
+                'unique_together': {('fetch', 'run', 'keyword')},
+            },
+        ),
+    ]
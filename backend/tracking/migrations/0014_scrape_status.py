@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0013_keyword_fetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keywordfetch',
+            name='scrape_statuses',
+            field=models.JSONField(blank=True, default=dict, verbose_name='順位ごとの取得状態'),
+        ),
+        migrations.AddField(
+            model_name='searchresult',
+            name='scrape_status',
+            field=models.CharField(choices=[('ok', '取得成功'), ('failed', '取得失敗'), ('skipped', 'スキップ')], default='ok', max_length=10, verbose_name='取得状態'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0014_scrape_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64, unique=True, verbose_name='URLハッシュ')),
+                ('url', models.URLField(max_length=2048, verbose_name='アフィリエイトリンクURL')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='affiliatelink',
+            name='link',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='occurrences', to='tracking.canonicallink', verbose_name='リンク'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_TRACKING_PARAMS = {"gclid", "dclid", "fbclid", "yclid", "msclkid", "twclid", "ttclid", "_ga", "_gl"}
+_TRACKING_PREFIXES = ("utm_", "mc_")
+
+
+def normalize_link_url(url):
+    # この時点の tracking.links.normalize_link_url の固定コピー。
+    # 保存済みのリンクはすべてASPのホストに一致したものなので、広告・解析用のパラメータだけを除く
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = parts.query
+    params = parse_qsl(query, keep_blank_values=True)
+    kept = [(k, v) for k, v in params if not (k.lower() in _TRACKING_PARAMS or k.lower().startswith(_TRACKING_PREFIXES))]
+    if len(kept) != len(params):
+        query = urlencode(kept)
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def backfill_canonical_link(apps, schema_editor):
+    AffiliateLink = apps.get_model("tracking", "AffiliateLink")
+    CanonicalLink = apps.get_model("tracking", "CanonicalLink")
+
+    links = AffiliateLink.objects.filter(link__isnull=True).only("id", "link_url").order_by("id")
+    batch = []
+    for link in links.iterator(chunk_size=BATCH_SIZE):
+        batch.append(link)
+        if len(batch) >= BATCH_SIZE:
+            _assign_links(batch, AffiliateLink, CanonicalLink)
+            batch = []
+    if batch:
+        _assign_links(batch, AffiliateLink, CanonicalLink)
+
+    # 正規化により同じ記事内で重複したリンクは、最初の1件だけ残す
+    duplicates = (
+        AffiliateLink.objects.values("search_result_id", "link_id")
+        .annotate(keep_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        AffiliateLink.objects.filter(search_result_id=row["search_result_id"], link_id=row["link_id"]).exclude(
+            id=row["keep_id"]
+        ).delete()
+
+
+def _assign_links(batch, AffiliateLink, CanonicalLink):
+    hash_by_id = {}
+    canonical = {}
+    for link in batch:
+        url = normalize_link_url(link.link_url)
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        hash_by_id[link.id] = url_hash
+        canonical.setdefault(url_hash, CanonicalLink(url_hash=url_hash, url=url[:2048]))
+    CanonicalLink.objects.bulk_create(canonical.values(), ignore_conflicts=True)
+    ids = dict(CanonicalLink.objects.filter(url_hash__in=canonical).values_list("url_hash", "id"))
+
+    for link in batch:
+        link.link_id = ids[hash_by_id[link.id]]
+    AffiliateLink.objects.bulk_update(batch, ["link"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0015_canonical_link'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_canonical_link, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0016_backfill_canonical_link'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='affiliatelink',
+            name='asp_name',
+            field=models.CharField(blank=True, db_index=True, max_length=100, verbose_name='ASP名'),
+        ),
+        migrations.RemoveField(
+            model_name='affiliatelink',
+            name='link_url',
+        ),
+        migrations.AlterField(
+            model_name='affiliatelink',
+            name='link',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='occurrences', to='tracking.canonicallink', verbose_name='リンク'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='affiliatelink',
+            unique_together={('search_result', 'link')},
+        ),
+    ]
@@ -1,5 +1,9 @@
+import re
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings  # ユーザーモデルを参照するために必要
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -72,6 +76,67 @@ class MediaSite(models.Model):
         return self.name or self.domain
 
 
+# 正規表現全体に作用するインラインフラグ ((?i) 等)。ホストごとに1つの正規表現へまとめると不正になる
+_GLOBAL_FLAGS_RE = re.compile(r"(?<!\\)\(\?[aiLmsux]+\)")
+
+
+def path_pattern_error(path_pattern):
+    """
+    AspRule.path_pattern が AspMatcher でまとめてコンパイルできない場合にその理由を、問題なければ None を返す
+    """
+    if _GLOBAL_FLAGS_RE.search(path_pattern):
+        return _("(?i) のようなパターン全体へのフラグは使えません。(?i:...) の形で指定してください。")
+    try:
+        re.compile(f"(?P<r0>{path_pattern})")
+    except re.error as e:
+        return _("正規表現として不正です: %(error)s") % {"error": e}
+    return None
+
+
+class AspRule(models.Model):
+    """
+    アフィリエイトリンクを判定するためのASPルール。
+    リンクのホスト名が host (またはそのサブドメイン) に一致し、
+    path_pattern が指定されていればパスも一致した場合にそのASPと判定する。
+    """
+
+    name = models.CharField(_("ASP名"), max_length=100)
+    host = models.CharField(_("ホスト"), max_length=255, help_text=_("例: a8.net (サブドメインも一致)"))
+    path_pattern = models.CharField(_("パスパターン(正規表現)"), max_length=255, blank=True)
+    is_active = models.BooleanField(_("有効"), default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("host", "path_pattern")
+
+    def __str__(self):
+        return f"{self.name} ({self.host})"
+
+    def clean(self):
+        if self.path_pattern:
+            error = path_pattern_error(self.path_pattern)
+            if error:
+                raise ValidationError({"path_pattern": error})
+
+
+class PageCache(models.Model):
+    """
+    記事ページの取得結果キャッシュ。
+    HTTPの検証子 (ETag / Last-Modified) と抽出済みのリンクをURLごとに保持する。
+    """
+
+    url_hash = models.CharField(_("URLハッシュ"), max_length=64, unique=True)
+    url = models.URLField(_("記事URL"), max_length=2048)
+    etag = models.CharField(_("ETag"), max_length=255, blank=True)
+    last_modified = models.CharField(_("Last-Modified"), max_length=64, blank=True)
+    rules_version = models.CharField(_("ASPルールバージョン"), max_length=32, blank=True)
+    links = models.JSONField(_("抽出済みリンク"), default=list)
+    fetched_at = models.DateTimeField(_("最終取得日時"))
+
+    def __str__(self):
+        return self.url
+
+
 class ExtractionRun(models.Model):
     """
     検索実行（スクレイピング）の履歴。
@@ -83,8 +148,10 @@ class ExtractionRun(models.Model):
         ("pending", _("Pending")),
         ("running", _("Running")),
         ("completed", _("Completed")),
+        ("completed_with_errors", _("Completed with errors")),
         ("failed", _("Failed")),
     ]
+    ACTIVE_STATUSES = ["pending", "running"]
     # === ▲ 修正 ▲ ===
 
     project = models.ForeignKey(Project, verbose_name=_("案件"), on_delete=models.CASCADE, related_name="runs")
@@ -94,18 +161,129 @@ class ExtractionRun(models.Model):
     # === ▼ 修正 ▼ ===
     # statusフィールドを追加
     # これにより admin.py と views.py が正しく動作するようになります
-    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default="pending")
+    status = models.CharField(_("Status"), max_length=32, choices=STATUS_CHOICES, default="pending")
     # === ▲ 修正 ▲ ===
 
+    # SERPキャッシュを使わずにAPIから再取得するか
+    force_refresh = models.BooleanField(_("SERP再取得"), default=False)
+    serp_cache_hits = models.IntegerField(_("SERPキャッシュヒット数"), default=0)
+    serp_cache_misses = models.IntegerField(_("SERPキャッシュミス数"), default=0)
+
+    # キーワード単位の進捗カウンタ (タスクごとにアトミックに加算される)
+    total_keywords = models.IntegerField(_("キーワード数"), default=0)
+    succeeded_keywords = models.IntegerField(_("成功キーワード数"), default=0)
+    failed_keywords = models.IntegerField(_("失敗キーワード数"), default=0)
+
     def __str__(self):
         return f"{self.project.name} @ {self.executed_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class ExtractionSchedule(models.Model):
+    """
+    案件ごとの定期実行スケジュール。
+    実行時刻は時間帯 (window_start〜window_end) の中でランダムに分散させ、多数の案件が同時刻に集中しないようにする。
+    """
+
+    FREQUENCY_CHOICES = [
+        ("daily", _("毎日")),
+        ("weekly", _("毎週")),
+    ]
+    WEEKDAY_CHOICES = [
+        (0, _("月曜日")),
+        (1, _("火曜日")),
+        (2, _("水曜日")),
+        (3, _("木曜日")),
+        (4, _("金曜日")),
+        (5, _("土曜日")),
+        (6, _("日曜日")),
+    ]
+
+    project = models.ForeignKey(Project, verbose_name=_("案件"), on_delete=models.CASCADE, related_name="schedules")
+    frequency = models.CharField(_("頻度"), max_length=10, choices=FREQUENCY_CHOICES, default="daily")
+    weekday = models.IntegerField(_("曜日"), choices=WEEKDAY_CHOICES, null=True, blank=True)  # 毎週の場合のみ
+    # 実行時間帯 (window_end <= window_start の場合は日付をまたぐ時間帯とみなす)
+    window_start = models.TimeField(_("実行時間帯 (開始)"))
+    window_end = models.TimeField(_("実行時間帯 (終了)"))
+    max_rank = models.IntegerField(_("最大抽出順位"), default=10)
+    is_active = models.BooleanField(_("有効"), default=True)
+    next_run_at = models.DateTimeField(_("次回実行日時"), null=True, blank=True, db_index=True)
+    last_run = models.ForeignKey(
+        ExtractionRun,
+        verbose_name=_("前回の実行履歴"),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.project.name} ({self.get_frequency_display()} {self.window_start:%H:%M}-{self.window_end:%H:%M})"
+
+    def clean(self):
+        if self.frequency == "weekly" and self.weekday is None:
+            raise ValidationError({"weekday": _("毎週のスケジュールには曜日を指定してください。")})
+
+
+class KeywordFetch(models.Model):
+    """
+    同じキーワード (正規化済み) の SERP 取得・記事スクレイピングを、案件をまたいで1回にまとめるための取得単位。
+    時間枠 (window_start) ごとに1件だけ作成され、最初に到着したタスク (リーダー) が取得を行い、
+    結果を購読している全ての ExtractionRun へ配信する。
+    """
+
+    STATUS_CHOICES = [
+        ("running", _("Running")),
+        ("completed", _("Completed")),
+        ("failed", _("Failed")),
+    ]
+
+    query = models.CharField(_("検索クエリ (正規化済み)"), max_length=255)
+    max_rank = models.IntegerField(_("最大抽出順位"))
+    # None の場合は他の実行と共有しない単独の取得 (SERP再取得の指定時)
+    window_start = models.DateTimeField(_("時間枠"), null=True, blank=True)
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default="running")
+    succeeded = models.BooleanField(_("成功"), default=True)
+    serp_results = models.JSONField(_("検索結果"), default=list, blank=True)
+    links_by_rank = models.JSONField(_("順位ごとのリンク"), default=dict, blank=True)
+    scrape_statuses = models.JSONField(_("順位ごとの取得状態"), default=dict, blank=True)
+    hit_count = models.BigIntegerField(_("ヒット件数"), default=0)
+    started_at = models.DateTimeField(_("取得開始日時"), default=timezone.now)
+    finished_at = models.DateTimeField(_("完了日時"), null=True, blank=True)
+
+    class Meta:
+        unique_together = ("query", "max_rank", "window_start")
+
+    def __str__(self):
+        return f"{self.query} (top{self.max_rank}, {self.status})"
+
+
+class KeywordFetchSubscription(models.Model):
+    """
+    KeywordFetch の結果を受け取る (実行履歴, キーワード) の組。配信済みかどうかを記録し、二重取り込みを防ぐ。
+    """
+
+    fetch = models.ForeignKey(KeywordFetch, on_delete=models.CASCADE, related_name="subscriptions")
+    run = models.ForeignKey(ExtractionRun, on_delete=models.CASCADE, related_name="fetch_subscriptions")
+    keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, related_name="fetch_subscriptions")
+    delivered = models.BooleanField(_("配信済み"), default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("fetch", "run", "keyword")
+
+
 class SearchResult(models.Model):
     """
     特定の検索実行における、キーワードごとの検索結果（記事）。
     """
 
+    SCRAPE_STATUS_CHOICES = [
+        ("ok", _("取得成功")),
+        ("failed", _("取得失敗")),
+        ("skipped", _("スキップ")),
+    ]
+
     run = models.ForeignKey(ExtractionRun, verbose_name=_("実行履歴"), on_delete=models.CASCADE, related_name="results")
     keyword = models.ForeignKey(Keyword, verbose_name=_("キーワード"), on_delete=models.CASCADE, related_name="results")
     media_site = models.ForeignKey(
@@ -114,6 +292,8 @@ class SearchResult(models.Model):
     rank = models.IntegerField(_("SEO順位"))
     page_url = models.URLField(_("掲載記事リンク"), max_length=2048)
     title = models.CharField(_("記事タイトル"), max_length=512, blank=True)
+    # 記事の取得結果 (skipped: ホストが不調 (サーキットオープン) のため取得しなかった)
+    scrape_status = models.CharField(_("取得状態"), max_length=10, choices=SCRAPE_STATUS_CHOICES, default="ok")
 
     def __str__(self):
         return f"[{self.rank}位] {self.keyword.text} - {self.media_site.domain}"
@@ -123,17 +303,96 @@ class SearchResult(models.Model):
         ordering = ["rank"]
 
 
+class ResultSummary(models.Model):
+    """
+    エクスポート・集計用に非正規化した検索結果1件分のサマリー。
+    キーワードの処理完了時に書き込まれ、エクスポートはこのテーブルのみを順に読む。
+    """
+
+    search_result = models.OneToOneField(
+        SearchResult, verbose_name=_("検索結果記事"), on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    run = models.ForeignKey(ExtractionRun, verbose_name=_("実行履歴"), on_delete=models.CASCADE, related_name="summaries")
+    keyword_text = models.CharField(_("キーワード"), max_length=255)
+    display_domain = models.CharField(_("メディア名"), max_length=255)
+    rank = models.IntegerField(_("SEO順位"))
+    title = models.CharField(_("記事タイトル"), max_length=512, blank=True)
+    page_url = models.URLField(_("掲載記事リンク"), max_length=2048, blank=True)
+    media_type = models.CharField(_("メディア種類"), max_length=32)
+    asp_list = models.CharField(_("提携ASP"), max_length=1024, blank=True)
+    link_urls = models.JSONField(_("リンク (上位10件)"), default=list)
+
+    class Meta:
+        indexes = [models.Index(fields=["run", "keyword_text", "rank"])]
+
+    def __str__(self):
+        return f"[{self.rank}位] {self.keyword_text} - {self.display_domain}"
+
+
+class CanonicalLink(models.Model):
+    """
+    正規化したアフィリエイトリンクURLの一覧。
+    同じリンクは実行・検索結果をまたいで1行だけ保存し、URLのハッシュで検索する。
+    """
+
+    url_hash = models.CharField(_("URLハッシュ"), max_length=64, unique=True)
+    url = models.URLField(_("アフィリエイトリンクURL"), max_length=2048)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
+
+
 class AffiliateLink(models.Model):
     """
-    (G) 記事内で検出されたアフィリエイトリンクの情報。
+    (G) 記事内で検出されたアフィリエイトリンク (検索結果記事と CanonicalLink の対応)。
+    ASP名は検出時点のルールで判定したものを保持する (ResultSummary.asp_list と一致させるため)。
     """
 
     search_result = models.ForeignKey(
         SearchResult, verbose_name=_("検索結果記事"), on_delete=models.CASCADE, related_name="affiliate_links"
     )
-    link_url = models.URLField(_("アフィリエイトリンクURL"), max_length=2048)
-    asp_name = models.CharField(_("ASP名"), max_length=100, blank=True)
+    link = models.ForeignKey(
+        CanonicalLink, verbose_name=_("リンク"), on_delete=models.PROTECT, related_name="occurrences"
+    )
+    asp_name = models.CharField(_("ASP名"), max_length=100, blank=True, db_index=True)
     product_name = models.CharField(_("商品名"), max_length=255, blank=True)
 
+    class Meta:
+        unique_together = ("search_result", "link")
+
+    def __str__(self):
+        return self.link.url
+
+
+class ExportJob(models.Model):
+    """
+    Excelエクスポートのバックグラウンドジョブと、その生成ファイル。
+    (案件, 最新の検索実行, エクスポート範囲) ごとに生成ファイルを再利用する。
+    """
+
+    STATUS_CHOICES = [
+        ("pending", _("Pending")),
+        ("running", _("Running")),
+        ("completed", _("Completed")),
+        ("failed", _("Failed")),
+    ]
+
+    project = models.ForeignKey(Project, verbose_name=_("案件"), on_delete=models.CASCADE, related_name="export_jobs")
+    run = models.ForeignKey(
+        ExtractionRun,
+        verbose_name=_("最新の実行履歴"),
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="export_jobs",
+    )
+    filters = models.JSONField(_("エクスポート範囲"), default=dict, blank=True)
+    status = models.CharField(_("Status"), max_length=20, choices=STATUS_CHOICES, default="pending")
+    file = models.FileField(_("生成ファイル"), upload_to="exports/", blank=True)
+    error = models.TextField(_("エラー内容"), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(_("完了日時"), null=True, blank=True)
+
     def __str__(self):
-        return self.link_url
+        return f"{self.project.name} export #{self.id} ({self.status})"
@@ -0,0 +1,76 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PageCache
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def lookup(urls, rules_version):
+    """
+    キャッシュを参照し、(TTL内で再利用できるリンク, 条件付きリクエスト用の検証子, キャッシュ行) を返す。
+    ASPルールが変更されている場合は抽出結果を再利用できないため、検証子も返さない。
+    """
+    hashes = {url_hash(url): url for url in urls}
+    entries = {hashes[entry.url_hash]: entry for entry in PageCache.objects.filter(url_hash__in=hashes)}
+
+    fresh_after = timezone.now() - timedelta(seconds=settings.PAGE_CACHE_TTL)
+    fresh = {}
+    validators = {}
+    for url, entry in entries.items():
+        if entry.rules_version != rules_version:
+            continue
+        if entry.fetched_at >= fresh_after:
+            fresh[url] = entry.links
+        elif entry.etag or entry.last_modified:
+            validators[url] = {"etag": entry.etag, "last_modified": entry.last_modified}
+    return fresh, validators, entries
+
+
+def store(pages, entries, rules_version):
+    """
+    フェッチ結果をキャッシュに反映し、{url: [リンク情報, ...]} を返す。
+    304 の場合はキャッシュ済みのリンクを再利用し、取得日時のみ更新する。
+    """
+    now = timezone.now()
+    links_by_url = {}
+    revalidated = []
+    upserts = []
+
+    for url, page in pages.items():
+        if page.status == 304 and url in entries:
+            entry = entries[url]
+            entry.fetched_at = now
+            revalidated.append(entry)
+            links_by_url[url] = entry.links
+            continue
+
+        links_by_url[url] = page.links or []
+        if page.status == 200:
+            upserts.append(
+                PageCache(
+                    url_hash=url_hash(url),
+                    url=url,
+                    etag=page.etag[:255],
+                    last_modified=page.last_modified[:64],
+                    rules_version=rules_version or "",
+                    links=page.links,
+                    fetched_at=now,
+                )
+            )
+
+    if revalidated:
+        PageCache.objects.bulk_update(revalidated, ["fetched_at"])
+    if upserts:
+        PageCache.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=["url_hash"],
+            update_fields=["url", "etag", "last_modified", "rules_version", "links", "fetched_at"],
+        )
+    return links_by_url
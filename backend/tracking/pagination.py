@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    主キーの降順によるカーソルページネーション。
+    OFFSET を使わないため、ページが深くなっても応答時間が一定に保たれる。
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = "-id"
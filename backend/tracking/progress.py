@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+
+from .models import ExtractionRun
+from .redis_client import get_redis
+
+# タスクが加算していく進捗カウンタ
+PROGRESS_COUNTERS = [
+    "keywords_succeeded",
+    "keywords_failed",
+    "urls_scraped",
+    "urls_shared",
+    "urls_skipped",
+    "links_found",
+    "api_calls",
+    "serp_cache_hits",
+]
+
+
+def progress_key(run_id):
+    return f"tracking:run:{run_id}:progress"
+
+
+def _write(run_id, apply):
+    """
+    進捗ハッシュへの書き込みを TTL の延長とまとめて1往復で行う。
+    書き込みに失敗しても抽出処理自体は継続する (進捗表示が一時的に古くなるだけ)。
+    """
+    key = progress_key(run_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        apply(pipe, key)
+        pipe.expire(key, settings.RUN_PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Run progress update failed (run={run_id}): {e}")
+
+
+def init_run_progress(run, owner_id):
+    mapping = {
+        "owner_id": owner_id,
+        "status": run.status,
+        "total_keywords": run.total_keywords,
+        "started_at": time.time(),
+        **{counter: 0 for counter in PROGRESS_COUNTERS},
+    }
+    _write(run.id, lambda pipe, key: pipe.hset(key, mapping=mapping))
+
+
+def incr_run_progress(run_id, **counters):
+    def apply(pipe, key):
+        for counter, amount in counters.items():
+            if amount:
+                pipe.hincrby(key, counter, amount)
+
+    _write(run_id, apply)
+
+
+def set_run_progress_status(run_id, status):
+    mapping = {"status": status}
+    if status not in ExtractionRun.ACTIVE_STATUSES:
+        mapping["finished_at"] = time.time()
+    _write(run_id, lambda pipe, key: pipe.hset(key, mapping=mapping))
+
+
+def get_run_progress(run_id):
+    """
+    進捗ハッシュを読み出し、処理済みキーワード数から残り時間 (eta_seconds) を推定して返す。
+    ハッシュが存在しない (TTL切れ・未開始) 場合は None。
+    """
+    raw = get_redis().hgetall(progress_key(run_id))
+    if not raw:
+        return None
+    data = {k.decode(): v.decode() for k, v in raw.items()}
+
+    progress = {"id": int(run_id), "status": data["status"], "total_keywords": int(data["total_keywords"])}
+    progress.update({counter: int(data.get(counter, 0)) for counter in PROGRESS_COUNTERS})
+
+    processed = progress["keywords_succeeded"] + progress["keywords_failed"]
+    started_at = float(data["started_at"])
+    finished_at = float(data["finished_at"]) if "finished_at" in data else None
+    elapsed = (finished_at or time.time()) - started_at
+
+    if finished_at is not None:
+        eta = 0
+    elif processed:
+        eta = round(elapsed / processed * max(progress["total_keywords"] - processed, 0))
+    else:
+        eta = None
+
+    progress.update(elapsed_seconds=round(elapsed), eta_seconds=eta, owner_id=int(data["owner_id"]))
+    return progress
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+# GCRA (Generic Cell Rate Algorithm) によるトークンバケット。
+# 次に許可される理論到着時刻 (TAT) を予約し、呼び出し側が待つべきミリ秒を返す。
+_RESERVE_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local wait = new_tat - burst * interval - now
+if wait < 0 then wait = 0 end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now + interval))
+return wait
+"""
+
+_reserve = None
+
+
+class RateLimiter:
+    """
+    Redis上の名前付きバケットで、全ワーカー合計のリクエストレートを rate (回/秒) に制限する。
+    burst 回までは待たずに連続で通す。
+    """
+
+    def __init__(self, name, rate, burst=1):
+        self.key = f"ratelimit:{name}"
+        self.interval_ms = max(1, int(1000 / rate))
+        self.burst = max(1, burst)
+
+    def reserve(self):
+        """
+        1回分の枠を予約し、実行までに待つべき秒数を返す
+        """
+        global _reserve
+        try:
+            if _reserve is None:
+                _reserve = get_redis().register_script(_RESERVE_SCRIPT)
+            wait_ms = _reserve(keys=[self.key], args=[self.interval_ms, self.burst])
+        except Exception as e:
+            print(f"Rate limiter unavailable ({self.key}): {e}")
+            return 0
+        return int(wait_ms) / 1000
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = await asyncio.to_thread(self.reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def google_cse_limiter(pages_per_search=1):
+    # GOOGLE_CSE_BURST が未指定の場合は、1検索分のページを待たずに送れるバーストにする
+    return RateLimiter("google_cse", settings.GOOGLE_CSE_RATE, settings.GOOGLE_CSE_BURST or pages_per_search)
+
+
+def host_limiter(host):
+    return RateLimiter(f"host:{host}", settings.SCRAPE_HOST_RATE, settings.SCRAPE_HOST_BURST)
@@ -0,0 +1,35 @@
+import random
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+
+def _window_bounds(schedule, day):
+    """
+    指定日に開始する実行時間帯の (開始日時, 終了日時) を返す
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, schedule.window_start), tz)
+    end = timezone.make_aware(datetime.combine(day, schedule.window_end), tz)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def next_run_at(schedule, after=None):
+    """
+    after より後に開始する次の実行時間帯を求め、その中からランダムに選んだ実行日時を返す。
+    ランダムなずらし (ジッター) により、同じ頻度・時間帯の案件が一斉に実行されないようにする。
+    """
+    if schedule.frequency == "weekly" and schedule.weekday is None:
+        raise ValueError("毎週のスケジュールには曜日の指定が必要です。")
+
+    after = timezone.localtime(after or timezone.now())
+    day = after.date()
+    # 前日に開始して日付をまたぐ時間帯は対象外とし、当日から最大8日先までの時間帯を調べる
+    for _ in range(8):
+        start, end = _window_bounds(schedule, day)
+        if start > after and (schedule.frequency == "daily" or day.weekday() == schedule.weekday):
+            return start + timedelta(seconds=random.uniform(0, (end - start).total_seconds()))
+        day += timedelta(days=1)
+    raise ValueError("次回の実行日時を決定できません。")
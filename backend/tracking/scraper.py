@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from . import http_client, page_cache
+from .asp_matcher import get_asp_matcher
+from .host_health import HostHealth
+from .link_parser import StreamingLinkExtractor
+from .links import normalize_link_url
+from .rate_limit import host_limiter
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+}
+
+# 1ページ分のフェッチ結果 (304 の場合 links は None、例外の場合 status は None)
+PageResult = namedtuple("PageResult", ["links", "status", "etag", "last_modified"])
+
+# サーキットが open のホストを取得せずにスキップした場合の PageResult.status
+SKIPPED = "skipped"
+
+
+def scrape_status(page):
+    """
+    PageResult を SearchResult.scrape_status の値に変換する
+    """
+    if page.status == SKIPPED:
+        return "skipped"
+    if page.status is None or page.status >= 400:
+        return "failed"
+    return "ok"
+
+
+def collect_affiliate_links(anchors, matcher):
+    """
+    (href, テキスト, img alt) のイテラブルから AspMatcher に一致するアフィリエイトリンクを抽出する。
+    ホスト名の大文字/小文字・既定ポート・フラグメントだけが異なるリンクは、正規化したURLで1件にまとめる。
+    """
+    found_links = {}
+
+    for href, text, img_alt in anchors:
+        if not href.startswith("http"):
+            continue
+        link_url = normalize_link_url(href, matcher)
+        if link_url in found_links:
+            continue
+
+        asp_name = matcher.match(href)
+        if not asp_name:
+            continue
+
+        product_name = text or img_alt
+        product_name = product_name[:100] if product_name else "画像リンク/テキストなし"
+
+        found_links[link_url] = {"asp_name": asp_name, "link_url": link_url, "product_name": product_name}
+    return list(found_links.values())
+
+
+class ArticleFetcher:
+    """
+    記事URLを並行取得してアフィリエイトリンクを抽出するフェッチエンジン。
+
+    全体の同時接続数とホストごとの同時接続数を制限し、さらにホストごとのリクエストレートを
+    全ワーカー共通のレートリミッターで制御することで、ドメイン単位でクロール先への負荷を抑える。
+    ホストごとの失敗率・レイテンシは HostHealth で共有し、タイムアウトの調整と不調なホストのスキップに使う。
+    """
+
+    def __init__(
+        self,
+        matcher,
+        max_concurrency=None,
+        per_host_concurrency=None,
+        timeout=None,
+        max_bytes=None,
+    ):
+        self.matcher = matcher
+        self.max_concurrency = max_concurrency or settings.SCRAPE_MAX_CONCURRENCY
+        self.per_host_concurrency = per_host_concurrency or settings.SCRAPE_PER_HOST_CONCURRENCY
+        self.timeout = timeout or settings.SCRAPE_TIMEOUT
+        self.max_bytes = max_bytes or settings.SCRAPE_MAX_BYTES
+
+        self._global_semaphore = None
+        self._host_semaphores = {}
+
+    def _host_slot(self, host):
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_semaphores[host]
+
+    async def _fetch_one(self, client, url, validator):
+        host = urlparse(url).netloc
+        health = HostHealth(host)
+        try:
+            # 応答しないホストはワーカーの枠を待たずに即座にスキップする
+            timeout = await health.permit_async(self.timeout)
+            if timeout is None:
+                print(f"Scraping Skipped ({url}): circuit open for {host}")
+                return url, PageResult([], SKIPPED, "", "")
+
+            async with self._host_slot(host), self._global_semaphore:
+                await host_limiter(host).acquire_async()
+                started = time.monotonic()
+                try:
+                    page = await self._fetch_page(client, url, validator, timeout)
+                except Exception:
+                    await health.record_async(failed=True)
+                    raise
+                await health.record_async(latency=time.monotonic() - started, failed=page.status >= 500)
+                return url, page
+        except Exception as e:
+            print(f"Scraping Error ({url}): {e}")
+            return url, PageResult([], None, "", "")
+
+    async def _fetch_page(self, client, url, validator, timeout):
+        headers = dict(REQUEST_HEADERS)
+        if validator:
+            if validator["etag"]:
+                headers["If-None-Match"] = validator["etag"]
+            if validator["last_modified"]:
+                headers["If-Modified-Since"] = validator["last_modified"]
+
+        # 本文を全て読み込まずにチャンク単位でパースし、max_bytes に達したら接続を切る
+        anchors = []
+        async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+            etag = response.headers.get("etag", "")
+            last_modified = response.headers.get("last-modified", "")
+            if response.status_code == 304:
+                return PageResult(None, 304, etag, last_modified)
+
+            extractor = StreamingLinkExtractor(response.headers.get("content-type"), max_bytes=self.max_bytes)
+            async for chunk in response.aiter_bytes():
+                anchors.extend(extractor.feed(chunk))
+                if extractor.exhausted:
+                    break
+            anchors.extend(extractor.close())
+        return PageResult(collect_affiliate_links(anchors, self.matcher), response.status_code, etag, last_modified)
+
+    async def fetch_all(self, urls, validators=None):
+        """
+        URLのリストを並行取得し、{url: PageResult} を返す。
+        validators ({url: {"etag": ..., "last_modified": ...}}) があれば条件付きリクエストを送る。
+        接続はワーカー内で共有するクライアントのプールから再利用する (ホストごとの接続数は per_host_concurrency 以下)。
+        """
+        validators = validators or {}
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        client = http_client.get_async_client()
+        pairs = await asyncio.gather(*(self._fetch_one(client, url, validators.get(url)) for url in dict.fromkeys(urls)))
+        return dict(pairs)
+
+
+def fetch_affiliate_links(urls, **fetcher_options):
+    """
+    同期コード(Celeryタスク)から ArticleFetcher を実行するためのエントリポイント。
+    ページキャッシュがTTL内であれば再利用し、期限切れのものは条件付きリクエストで再検証する。
+    ({url: [リンク情報, ...]}, {url: 取得状態 ("ok" / "failed" / "skipped")}) を返す。
+    """
+    if not urls:
+        return {}, {}
+    # ORMへのアクセスはイベントループの外で行う
+    matcher = get_asp_matcher()
+    fresh, validators, entries = page_cache.lookup(urls, matcher.version)
+
+    stale_urls = [url for url in urls if url not in fresh]
+    pages = {}
+    if stale_urls:
+        fetcher = ArticleFetcher(matcher, **fetcher_options)
+        pages = http_client.run_async(fetcher.fetch_all(stale_urls, validators))
+
+    links_by_url = page_cache.store(pages, entries, matcher.version)
+    links_by_url.update(fresh)
+    status_by_url = {url: scrape_status(page) for url, page in pages.items()}
+    status_by_url.update({url: "ok" for url in fresh})
+    return links_by_url, status_by_url
+
+
+def extract_affiliate_links_from_url(article_url):
+    links_by_url, _ = fetch_affiliate_links([article_url])
+    return links_by_url.get(article_url, [])
@@ -1,5 +1,17 @@
+from django.db.models import F
 from rest_framework import serializers
-from .models import Genre, Project, Keyword, MediaSite, ExtractionRun, SearchResult, AffiliateLink
+from rest_framework.reverse import reverse
+from .models import (
+    Genre,
+    Project,
+    Keyword,
+    MediaSite,
+    ExtractionRun,
+    ExtractionSchedule,
+    SearchResult,
+    AffiliateLink,
+    ExportJob,
+)
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -32,10 +44,56 @@ class ExtractionRunSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExtractionRun
         # 修正: 'status' フィールドを追加し、フロントエンドに状態を返すように変更
-        fields = ["id", "project", "max_rank", "executed_at", "status"]
+        fields = [
+            "id",
+            "project",
+            "max_rank",
+            "executed_at",
+            "status",
+            "force_refresh",
+            "serp_cache_hits",
+            "serp_cache_misses",
+            "total_keywords",
+            "succeeded_keywords",
+            "failed_keywords",
+        ]
+
+
+class ExtractionScheduleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExtractionSchedule
+        fields = [
+            "id",
+            "project",
+            "frequency",
+            "weekday",
+            "window_start",
+            "window_end",
+            "max_rank",
+            "is_active",
+            "next_run_at",
+            "last_run",
+            "created_at",
+        ]
+        read_only_fields = ["next_run_at", "last_run"]
+
+    def validate_project(self, project):
+        # 他のユーザーの案件にはスケジュールを登録できない
+        if project.owner_id != self.context["request"].user.id:
+            raise serializers.ValidationError("案件が見つかりません。")
+        return project
+
+    def validate(self, attrs):
+        frequency = attrs.get("frequency", getattr(self.instance, "frequency", "daily"))
+        weekday = attrs.get("weekday", getattr(self.instance, "weekday", None))
+        if frequency == "weekly" and weekday is None:
+            raise serializers.ValidationError({"weekday": "毎週のスケジュールには曜日を指定してください。"})
+        return attrs
 
 
 class AffiliateLinkSerializer(serializers.ModelSerializer):
+    link_url = serializers.CharField(source="link.url", read_only=True)
+
     class Meta:
         model = AffiliateLink
         fields = ["id", "link_url", "asp_name", "product_name"]
@@ -46,4 +104,42 @@ class SearchResultSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SearchResult
-        fields = ["id", "run", "keyword", "media_site", "rank", "page_url", "title", "affiliate_links"]
+        fields = ["id", "run", "keyword", "media_site", "rank", "page_url", "title", "scrape_status", "affiliate_links"]
+
+
+# 高速読み取りパスで .values() に渡す列 (SearchResultSerializer の affiliate_links 以外のフィールド)
+SEARCH_RESULT_VALUE_FIELDS = [f for f in SearchResultSerializer.Meta.fields if f != "affiliate_links"]
+
+
+def serialize_search_results_fast(rows):
+    """
+    SearchResultSerializer と同じ形のデータを、.values() の行 (dict) から直接組み立てる。
+    一覧表示で ModelSerializer のインスタンス生成コストを避けるために使う。
+    """
+    links_by_result = {}
+    links = (
+        AffiliateLink.objects.filter(search_result_id__in=[row["id"] for row in rows])
+        .order_by("id")
+        .values("id", "search_result_id", "asp_name", "product_name", link_url=F("link__url"))
+    )
+    for link in links:
+        links_by_result.setdefault(link["search_result_id"], []).append(
+            {field: link[field] for field in AffiliateLinkSerializer.Meta.fields}
+        )
+
+    for row in rows:
+        row["affiliate_links"] = links_by_result.get(row["id"], [])
+    return rows
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ["id", "project", "run", "filters", "status", "error", "created_at", "finished_at", "download_url"]
+
+    def get_download_url(self, obj):
+        if obj.status != "completed":
+            return None
+        return reverse("export-download", args=[obj.id], request=self.context.get("request"))
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import math
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from . import http_client
+from .rate_limit import google_cse_limiter
+
+# 1ページあたりの最大件数 (Google Custom Search API の上限)
+PAGE_SIZE = 10
+
+
+class SerpProvider(ABC):
+    """
+    検索結果 (SERP) の取得元のインターフェース。
+
+    search() は以下の形式の dict を返す (取得元が利用できない場合は None):
+        {"results": [{"rank", "title", "url", "snippet"}, ...], "hit_count": int,
+         "cache_hits": int, "cache_misses": int, "error": bool}
+
+    "error" は取得エラーで検索結果を1件も得られなかったことを表す (検索結果が本当に0件の場合は False)。
+    """
+
+    @abstractmethod
+    def search(self, keyword, max_rank=10, force_refresh=False):
+        """キーワードの検索結果を返す (サブクラスで実装する)"""
+
+
+def build_results(pages, max_rank):
+    """
+    Custom Search API 形式のレスポンス ({"items": [{"title", "link", "snippet"}, ...]}) のリストから、
+    通し番号の順位を付けた検索結果を作る。件数が1ページ分に満たないページ以降は使わない。
+    """
+    results = []
+    for data in pages:
+        items = data.get("items", [])
+        for item in items[: max_rank - len(results)]:
+            results.append(
+                {
+                    "rank": len(results) + 1,
+                    "title": item.get("title"),
+                    "url": item.get("link"),
+                    "snippet": item.get("snippet"),
+                }
+            )
+        if len(items) < PAGE_SIZE or len(results) >= max_rank:
+            break
+    return results
+
+
+def _serp_cache_key(params):
+    # APIキー以外のクエリ条件 (q, cx, gl, hl, start, num) でキーを作る
+    cache_params = {k: v for k, v in params.items() if k != "key"}
+    digest = hashlib.sha256(json.dumps(cache_params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"serp:{digest}"
+
+
+def _available_pages(first_page, page_count):
+    """
+    1ページ目のレスポンスから、実際に結果が存在するページ数 (最大 page_count) を返す
+    """
+    if len(first_page.get("items", [])) < PAGE_SIZE:
+        return 1
+    total = int(first_page.get("searchInformation", {}).get("totalResults", "0") or 0)
+    if total:
+        return min(page_count, math.ceil(total / PAGE_SIZE))
+    return page_count
+
+
+class GoogleCSEProvider(SerpProvider):
+    """
+    Google Custom Search API を使用して検索を実行する。
+    1ページ目で総件数を確認し、結果が存在する残りのページ (start=11, 21, ...) だけを
+    レートリミッターの範囲内で並行に取得する (APIクォータを無駄に消費しない)。
+    各ページのレスポンスは SERP_CACHE_TTL 秒間キャッシュする (force_refresh=True で再取得)。
+    """
+
+    endpoint = "https://www.googleapis.com/customsearch/v1"
+
+    def __init__(self, api_key=None, cse_id=None):
+        self.api_key = api_key or settings.GOOGLE_CSE_API_KEY
+        self.cse_id = cse_id or settings.GOOGLE_CSE_ID
+
+    def _page_params(self, keyword, start):
+        return {
+            "key": self.api_key,
+            "cx": self.cse_id,
+            "q": keyword,
+            "num": PAGE_SIZE,  # 1リクエストあたりの最大件数
+            "start": start,
+            "gl": "jp",  # 地域: 日本
+            "hl": "ja",  # 言語: 日本語
+        }
+
+    def search(self, keyword, max_rank=10, force_refresh=False):
+        if not self.api_key or not self.cse_id:
+            print("Error: Google API Key or CSE ID is not configured.")
+            return None
+
+        page_params = [self._page_params(keyword, start) for start in range(1, max_rank + 1, PAGE_SIZE)]
+        cache_keys = [_serp_cache_key(params) for params in page_params]
+        cached = {} if force_refresh else cache.get_many(cache_keys)
+        fetched = {}
+
+        def fetch(indexes):
+            # キャッシュに無いページをまとめて並行取得する (既定のバーストは1検索分のページ数のため、レートの範囲内なら待たない)
+            limiter = google_cse_limiter(len(page_params))
+            responses = http_client.run_async(self._fetch_pages(keyword, [page_params[i] for i in indexes], limiter))
+            pages = {cache_keys[i]: data for i, data in zip(indexes, responses) if data is not None}
+            cache.set_many(pages, timeout=settings.SERP_CACHE_TTL)
+            fetched.update(pages)
+
+        missing = [0] if cache_keys[0] not in cached else []
+        if missing:
+            fetch(missing)
+        first_page = cached.get(cache_keys[0]) or fetched.get(cache_keys[0])
+
+        # 1ページ目の件数・総件数から、結果が存在しないページは取得しない
+        page_count = _available_pages(first_page, len(page_params)) if first_page else 0
+        rest = [i for i in range(1, page_count) if cache_keys[i] not in cached]
+        if rest:
+            fetch(rest)
+            missing += rest
+
+        # 取得に失敗したページがあれば、その手前までの結果を使う
+        pages = []
+        for key in cache_keys[:page_count]:
+            data = cached.get(key) or fetched.get(key)
+            if data is None:
+                break
+            pages.append(data)
+
+        hit_count = 0
+        if pages and "searchInformation" in pages[0]:
+            hit_count = int(pages[0]["searchInformation"].get("totalResults", "0"))
+
+        return {
+            "results": build_results(pages, max_rank),
+            "hit_count": hit_count,
+            "cache_hits": sum(1 for key in cache_keys[:page_count] if key in cached),
+            "cache_misses": len(missing),
+            # 1ページ目も取得できなかった場合は、0件の検索結果と区別してエラーとして返す
+            "error": not pages,
+        }
+
+    async def _fetch_pages(self, keyword, page_params, limiter):
+        client = http_client.get_async_client()
+        return await asyncio.gather(*(self._fetch_page(client, keyword, params, limiter) for params in page_params))
+
+    async def _fetch_page(self, client, keyword, params, limiter):
+        try:
+            await limiter.acquire_async()
+            print(f"API Request: {keyword} (start={params['start']})...")
+            response = await client.get(self.endpoint, params=params, timeout=30)
+
+            if response.status_code != 200:
+                print(f"Google API Error: {response.status_code} - {response.text}")
+                return None
+            return response.json()
+        except Exception as e:
+            print(f"API Execution Error: {e}")
+            return None
+
+
+class FixtureSerpProvider(SerpProvider):
+    """
+    JSON ファイルに保存した検索結果を返すテスト・開発用のプロバイダー (外部APIを呼び出さない)。
+    ファイル形式は Custom Search API のレスポンスに合わせる:
+        {"キーワード": {"searchInformation": {"totalResults": "123"}, "items": [{"title", "link", "snippet"}, ...]}}
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.SERP_FIXTURE_PATH
+
+    def search(self, keyword, max_rank=10, force_refresh=False):
+        if not self.path:
+            print("Error: SERP_FIXTURE_PATH is not configured.")
+            return None
+
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f).get(keyword, {})
+        return {
+            "results": build_results([data], max_rank) if data else [],
+            "hit_count": int(data.get("searchInformation", {}).get("totalResults", "0")),
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "error": False,
+        }
+
+
+_provider = None
+
+
+def get_serp_provider():
+    """
+    SERP_PROVIDER (クラスのドット区切りパス) で指定したプロバイダーを返す
+    """
+    global _provider
+    if _provider is None:
+        _provider = import_string(settings.SERP_PROVIDER)()
+    return _provider
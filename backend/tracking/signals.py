@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .asp_matcher import invalidate_asp_matcher
+from .authentication import token_cache_key
+from .models import AspRule, ExportJob
+
+
+@receiver(post_save, sender=AspRule)
+@receiver(post_delete, sender=AspRule)
+def asp_rule_changed(sender, **kwargs):
+    # 全ワーカーのキャッシュ済み AspMatcher を無効化する
+    invalidate_asp_matcher()
+
+
+@receiver(post_delete, sender=ExportJob)
+def export_job_deleted(sender, instance, **kwargs):
+    # 生成済みのExcelファイルも削除する
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # ログアウト等で削除されたトークンをキャッシュからも破棄する
+    cache.delete(token_cache_key(instance.key))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, **kwargs):
+    # 無効化などユーザーの変更を、キャッシュ済みのトークンにも反映させる
+    cache.delete_many([token_cache_key(key) for key in Token.objects.filter(user=instance).values_list("key", flat=True)])
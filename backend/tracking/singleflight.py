@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+# 取得中であることを表す値 (取得済みの場合は結果のJSONが入る)
+PENDING = b""
+
+
+class RunFetchRegistry:
+    """
+    1つの ExtractionRun 内で記事URLの取得を1回にまとめるための Redis 上の登録簿 (single-flight)。
+    最初に claim したタスクだけが取得し、結果を publish する。同じURLを扱う他のタスクは wait で結果を受け取る。
+    """
+
+    def __init__(self, run_id):
+        self.prefix = f"tracking:run:{run_id}:page"
+
+    def _key(self, normalized_url):
+        return f"{self.prefix}:{hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()}"
+
+    def claim(self, normalized_urls):
+        """
+        (自分が取得すべきURL, 取得済みの結果 {url: (links, status)}, 他のタスクが取得中のURL) を返す
+        """
+        pipe = get_redis().pipeline()
+        for url in normalized_urls:
+            pipe.set(self._key(url), PENDING, nx=True, ex=settings.RUN_FETCH_CLAIM_TTL)
+        for url in normalized_urls:
+            pipe.get(self._key(url))
+        replies = pipe.execute()
+        claimed, values = replies[: len(normalized_urls)], replies[len(normalized_urls) :]
+
+        owned, done, pending = [], {}, []
+        for url, is_owner, value in zip(normalized_urls, claimed, values):
+            if is_owner:
+                owned.append(url)
+            elif value:
+                done[url] = tuple(json.loads(value))
+            else:
+                pending.append(url)
+        return owned, done, pending
+
+    def publish(self, results):
+        """
+        取得結果 {url: (links, status)} を登録し、待機中のタスクに共有する
+        """
+        if not results:
+            return
+        try:
+            pipe = get_redis().pipeline()
+            for url, result in results.items():
+                pipe.set(self._key(url), json.dumps(result, ensure_ascii=False), ex=settings.RUN_FETCH_REGISTRY_TTL)
+            pipe.execute()
+        except Exception as e:
+            # 共有できなくても、待機中のタスクは claim の期限切れ後に自分で取得する
+            print(f"Run fetch registry unavailable ({self.prefix}): {e}")
+
+    def release(self, normalized_urls):
+        """
+        取得に失敗した場合に claim を取り消し、他のタスクが取得できるようにする
+        """
+        if not normalized_urls:
+            return
+        try:
+            get_redis().delete(*[self._key(url) for url in normalized_urls])
+        except Exception as e:
+            print(f"Run fetch registry unavailable ({self.prefix}): {e}")
+
+    def wait(self, normalized_urls, timeout):
+        """
+        他のタスクが取得中のURLの結果を最大 timeout 秒待ち、取得できた分を {url: (links, status)} で返す
+        """
+        results = {}
+        remaining = list(normalized_urls)
+        deadline = time.monotonic() + timeout
+        while remaining:
+            values = get_redis().mget([self._key(url) for url in remaining])
+            for url, value in zip(remaining, values):
+                if value:
+                    results[url] = tuple(json.loads(value))
+            # キーが消えた (claim の期限切れ・取り消し) URL も待つのをやめ、呼び出し側で取得する
+            remaining = [url for url, value in zip(remaining, values) if value == PENDING]
+            if remaining:
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(settings.RUN_FETCH_POLL_INTERVAL)
+        return results
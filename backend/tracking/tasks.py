@@ -1,225 +1,374 @@
-from celery import shared_task
-from .models import ExtractionRun, Keyword, SearchResult, MediaSite, AffiliateLink
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
+from celery import chord, shared_task
+from . import fetch_planner
+from .events import publish_run_event
+from .exports import write_excel
+from .ingest import ingest_keyword_results
+from .links import normalize_url
+from .models import ExportJob, ExtractionRun, ExtractionSchedule, Keyword, KeywordFetch, KeywordFetchSubscription
+from .progress import incr_run_progress, init_run_progress, set_run_progress_status
+from .scheduling import next_run_at
+from .scraper import fetch_affiliate_links
+from .serp import get_serp_provider
+from .singleflight import RunFetchRegistry
+from datetime import timedelta
 
 # 設定ファイルを読み込み
 from django.conf import settings
-from urllib.parse import urlparse
-
-# ASPドメインリスト (変更なし)
-ASP_DOMAINS = {
-    "a8.net": "A8",
-    "afi-b": "afb",
-    "affiliate-b": "afb",
-    "valuecommerce": "ValueCommerce",
-    "accesstrade": "AccessTrade",
-    "rentracks": "Rentracks",
-    "felmat": "Felmat",
-    "moshimo": "もしも",
-    "medipartner": "MediPartner",
-    "zucks": "Zucks Affiliate",
-    "j-a-net": "JANet",
-    "ad-track": "アドトラック",
-    "affitown": "affitown",
-    "presco": "Presco",
-}
-
-
-def search_google(keyword, max_rank=10):
-    """
-    Google Custom Search APIを使用して検索を実行する
-    """
-    api_key = settings.GOOGLE_CSE_API_KEY
-    cse_id = settings.GOOGLE_CSE_ID
-
-    if not api_key or not cse_id:
-        print("Error: Google API Key or CSE ID is not configured.")
-        return None
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
 
-    url = "https://www.googleapis.com/customsearch/v1"
-    all_results = []
-    total_hit_count = 0
-
-    # 通し番号用の変数を定義
-    current_rank_counter = 1
-
-    # APIは1回で最大10件取得。max_rankまでループで取得する
-    for start_index in range(1, max_rank + 1, 10):
-        params = {
-            "key": api_key,
-            "cx": cse_id,
-            "q": keyword,
-            "num": 10,  # 1リクエストあたりの最大件数
-            "start": start_index,
-            "gl": "jp",  # 地域: 日本
-            "hl": "ja",  # 言語: 日本語
-        }
 
-        try:
-            print(f"API Request: {keyword} (start={start_index})...")
-            response = requests.get(url, params=params, timeout=30)
+def _chunked(items, size):
+    return [items[i : i + size] for i in range(0, len(items), size)]
 
-            if response.status_code != 200:
-                print(f"Google API Error: {response.status_code} - {response.text}")
-                break
 
-            data = response.json()
+def _record_keyword_outcome(run_id, keyword_id, succeeded):
+    """
+    キーワード1件の成否をカウンタに加算し、全キーワードが処理済みになった時点で終了状態へ遷移させる。
+    遷移は状態が pending/running の行に対する条件付きUPDATEのため、並行するワーカー間でも1回だけ行われる。
+    """
+    counter = "succeeded_keywords" if succeeded else "failed_keywords"
+    ExtractionRun.objects.filter(id=run_id).update(**{counter: F(counter) + 1})
+
+    finished = ExtractionRun.objects.filter(
+        id=run_id,
+        status__in=ExtractionRun.ACTIVE_STATUSES,
+        succeeded_keywords__gte=F("total_keywords") - F("failed_keywords"),
+    ).update(
+        status=Case(
+            When(succeeded_keywords=0, failed_keywords__gt=0, then=Value("failed")),
+            When(failed_keywords__gt=0, then=Value("completed_with_errors")),
+            default=Value("completed"),
+        )
+    )
+    incr_run_progress(run_id, **{"keywords_succeeded" if succeeded else "keywords_failed": 1})
+    publish_run_event(run_id, "keyword", keyword_id=keyword_id, succeeded=succeeded)
+    if finished:
+        print(f"Run {run_id} FINISHED.")
+        snapshot = publish_run_event(run_id, "status")
+        if snapshot:
+            set_run_progress_status(run_id, snapshot["status"])
 
-            # ヒット件数の取得
-            if start_index == 1 and "searchInformation" in data:
-                total_results_str = data["searchInformation"].get("totalResults", "0")
-                total_hit_count = int(total_results_str)
 
-            items = data.get("items", [])
-            if not items:
-                break
+@shared_task(bind=True)
+def enqueue_extraction_for_keyword(self, run_id, keyword_id):
+    """
+    SERPステージ: 検索を実行し、記事ごとのスクレイピングをサブタスクへファンアウトする。
+    同じ時間枠に他の案件が同じキーワードを取得中・取得済みの場合は、取得せずにその結果の配信を待つ。
+    全サブタスク完了後に complete_keyword_fetch がコールバックとして結果を保存し、購読中の全実行へ配信する。
+    """
+    fetch_id = None
+    try:
+        run = ExtractionRun.objects.get(id=run_id)
+        keyword = Keyword.objects.get(id=keyword_id)
 
-            for item in items:
-                rank = current_rank_counter
+        if ExtractionRun.objects.filter(id=run_id, status="pending").update(status="running"):
+            set_run_progress_status(run_id, "running")
+            publish_run_event(run_id, "status")
 
-                if rank > max_rank:
-                    break
+        fetch, subscription, role = fetch_planner.subscribe(run, keyword)
+        if role == "ready":
+            deliver_keyword_fetch.delay(subscription.id)
+            return f"Reused: {keyword.text} (fetch={fetch.id})"
+        if role == "follower":
+            return f"Waiting: {keyword.text} (fetch={fetch.id})"
+        fetch_id = fetch.id
 
-                all_results.append(
-                    {
-                        "rank": rank,
-                        "title": item.get("title"),
-                        "url": item.get("link"),
-                        "snippet": item.get("snippet"),
-                    }
-                )
+        print(f"Task started: {keyword.text}")
 
-                current_rank_counter += 1
+        # 検索実行 (取得元は SERP_PROVIDER で切り替える)
+        search_data = get_serp_provider().search(keyword.text, max_rank=run.max_rank, force_refresh=run.force_refresh)
+        if search_data:
+            ExtractionRun.objects.filter(id=run_id).update(
+                serp_cache_hits=F("serp_cache_hits") + search_data["cache_hits"],
+                serp_cache_misses=F("serp_cache_misses") + search_data["cache_misses"],
+            )
+            # キャッシュミスした分だけ Google API を呼び出している
+            incr_run_progress(
+                run_id, api_calls=search_data["cache_misses"], serp_cache_hits=search_data["cache_hits"]
+            )
 
-            if len(items) < 10:
-                break
+        if not search_data or search_data["error"]:
+            # 設定不備・APIエラーは取得結果として保存せず失敗にする (次の購読者がリーダーとして取り直す)
+            print(f"Google search failed for '{keyword.text}'")
+            fail_keyword_fetch(fetch_id)
+            return f"Failed: {keyword.text}"
+
+        if not search_data["results"]:
+            print(f"No results for '{keyword.text}'")
+            complete_keyword_fetch([], fetch_id, [])
+            return f"Success: {keyword.text}"
+
+        serp_results = [
+            {"rank": data["rank"], "title": data["title"], "url": data["url"]} for data in search_data["results"]
+        ]
+        print(f"Found {len(serp_results)} results via API.")
+
+        # 指定順位までアフィリエイトリンク抽出
+        scrape_targets = [[data["rank"], data["url"]] for data in serp_results if data["rank"] <= run.max_rank]
+
+        # 記事スクレイピングを小さなバッチ単位のサブタスクに分割し、完了後に取得結果を確定する
+        header = [
+            scrape_search_results.s(run_id, batch) for batch in _chunked(scrape_targets, settings.SCRAPE_BATCH_SIZE)
+        ]
+        callback = complete_keyword_fetch.s(fetch_id, serp_results, search_data.get("hit_count", 0))
+        # サブタスクがワーカーの停止などで失敗した場合も、購読中の全キーワードを失敗として確定させる
+        callback.on_error(fail_keyword_fetch.si(fetch_id))
+        if header:
+            chord(header)(callback)
+        else:
+            callback.delay([])
 
-            if current_rank_counter > max_rank:
-                break
+        return f"Dispatched: {keyword.text} ({len(scrape_targets)} urls / {len(header)} batches)"
 
-            time.sleep(0.5)
+    except Exception as e:
+        print(f"Task failed: {e}")
+        if fetch_id is None:
+            _record_keyword_outcome(run_id, keyword_id, succeeded=False)
+        else:
+            fail_keyword_fetch(fetch_id)
+        return f"Error: {str(e)}"
+
+
+def _fetch_pages_once_per_run(run_id, urls):
+    """
+    同じ実行内の他のタスク (別キーワード) と記事URLの取得を共有し、{正規化URL: (links, status)} と
+    他のタスクの取得結果を再利用したURL数を返す。各URLの取得・パースは実行ごとに1回だけ行われる。
+    """
+    originals = {}
+    for url in urls:
+        originals.setdefault(normalize_url(url), url)
 
-        except Exception as e:
-            print(f"API Execution Error: {e}")
-            break
+    registry = RunFetchRegistry(run_id)
+    try:
+        owned, pages, pending = registry.claim(list(originals))
+    except Exception as e:
+        print(f"Run fetch registry unavailable (run={run_id}): {e}")
+        owned, pages, pending = list(originals), {}, []
+    shared = len(pages)
 
-    return {"results": all_results, "hit_count": total_hit_count}
+    def fetch(normalized_urls):
+        try:
+            links_by_url, status_by_url = fetch_affiliate_links([originals[url] for url in normalized_urls])
+        except Exception:
+            registry.release(normalized_urls)
+            raise
+        fetched = {
+            url: (links_by_url.get(originals[url], []), status_by_url.get(originals[url], "failed"))
+            for url in normalized_urls
+        }
+        registry.publish(fetched)
+        return fetched
 
+    pages.update(fetch(owned))
+    if pending:
+        # 他のタスクが取得中のURLは結果を待ち、時間内に得られなかった分だけ自分で取得する
+        waited = registry.wait(pending, timeout=settings.RUN_FETCH_WAIT_TIMEOUT)
+        shared += len(waited)
+        pages.update(waited)
+        pages.update(fetch([url for url in pending if url not in waited]))
+    return pages, shared
 
-def extract_affiliate_links_from_url(article_url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
-    }
-    found_links = []
 
+@shared_task
+def scrape_search_results(run_id, targets):
+    """
+    スクレイピングステージ: [[rank, url], ...] を並行取得し、[[rank, [リンク情報, ...], 取得状態], ...] を返す。
+    例外はここで握りつぶし、コールバック(complete_keyword_fetch)が必ず実行されるようにする。
+    """
     try:
-        time.sleep(random.uniform(1, 2))
-        response = requests.get(article_url, headers=headers, timeout=15)
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        for a_tag in soup.find_all("a", href=True):
-            href = a_tag.get("href")
-            if not href or not href.startswith("http"):
-                continue
-
-            for asp_key, asp_name in ASP_DOMAINS.items():
-                if asp_key in href:
-                    product_name = a_tag.get_text(strip=True)
-                    if not product_name:
-                        img = a_tag.find("img")
-                        if img and img.get("alt"):
-                            product_name = img.get("alt")
-
-                    product_name = product_name[:100] if product_name else "画像リンク/テキストなし"
-
-                    if not any(link["link_url"] == href for link in found_links):
-                        found_links.append({"asp_name": asp_name, "link_url": href, "product_name": product_name})
-                    break
-        return found_links
+        pages, shared = _fetch_pages_once_per_run(run_id, [url for _, url in targets])
+        results = []
+        for rank, url in targets:
+            links, scrape_status = pages.get(normalize_url(url), ([], "failed"))
+            results.append([rank, links, scrape_status])
+        # 取得したURL数・リンク数は、共有先の実行にも数えられるよう配信時 (deliver_keyword_fetch) に加算する
+        incr_run_progress(run_id, urls_shared=shared)
+        return results
     except Exception as e:
-        print(f"Scraping Error ({article_url}): {e}")
-        return []
+        print(f"Scrape batch failed (run={run_id}): {e}")
+        return [[rank, [], "failed"] for rank, _ in targets]
 
 
-@shared_task(bind=True)
-def enqueue_extraction_for_keyword(self, run_id, keyword_id):
+@shared_task
+def complete_keyword_fetch(batch_results, fetch_id, serp_results, hit_count=0, succeeded=True):
+    """
+    chordコールバック: 1キーワード分の取得結果を KeywordFetch に保存し、購読中の全実行へ配信する
+    """
+    rows = [row for batch in batch_results for row in batch]
+    links_by_rank = {rank: links for rank, links, _ in rows}
+    scrape_statuses = {rank: scrape_status for rank, _, scrape_status in rows}
+    subscription_ids = fetch_planner.complete(
+        fetch_id, serp_results, links_by_rank, scrape_statuses, hit_count=hit_count, succeeded=succeeded
+    )
+    for subscription_id in subscription_ids:
+        deliver_keyword_fetch.delay(subscription_id)
+    return f"Completed: fetch={fetch_id} ({len(subscription_ids)} subscribers)"
+
+
+@shared_task
+def fail_keyword_fetch(fetch_id):
+    print(f"Keyword fetch {fetch_id} failed.")
+    for subscription_id in fetch_planner.fail(fetch_id):
+        deliver_keyword_fetch.delay(subscription_id)
+
+
+@shared_task
+def fail_stale_keyword_fetches():
+    """
+    celery beat から定期実行され、KEYWORD_FETCH_TIMEOUT 秒を過ぎても running のままの取得
+    (ワーカーの再起動などでリーダーのタスク・chord が失われたもの) を失敗として確定し、購読中の全実行へ配信する
+    """
+    failed = 0
+    for fetch_id in fetch_planner.stale_fetch_ids():
+        subscription_ids = fetch_planner.fail(fetch_id, stale_only=True)
+        if subscription_ids is None:
+            continue
+        print(f"Keyword fetch {fetch_id} timed out.")
+        failed += 1
+        for subscription_id in subscription_ids:
+            deliver_keyword_fetch.delay(subscription_id)
+    return f"Failed {failed} stale keyword fetches"
+
+
+@shared_task
+def deliver_keyword_fetch(subscription_id):
+    """
+    KeywordFetch の結果を1つの (実行履歴, キーワード) へ取り込み、ExtractionRun の進捗を更新する。
+    配信済みフラグを行ロック下で確認するため、同じ購読へ重複して配信されても取り込みは1回だけ行われる。
+    """
+    subscription = KeywordFetchSubscription.objects.get(id=subscription_id)
+    run_id, keyword_id = subscription.run_id, subscription.keyword_id
+    counters = {}
     try:
-        run = ExtractionRun.objects.get(id=run_id)
-        keyword = Keyword.objects.get(id=keyword_id)
+        with transaction.atomic():
+            subscription = (
+                KeywordFetchSubscription.objects.select_for_update()
+                .select_related("fetch", "run")
+                .get(id=subscription_id)
+            )
+            if subscription.delivered:
+                return f"Already delivered: subscription={subscription_id}"
+
+            fetch = subscription.fetch
+            succeeded = fetch.status == "completed" and fetch.succeeded
+            if fetch.status == "completed":
+                # JSONに保存すると順位のキーが文字列になるため、数値に戻して取り込む
+                links_by_rank = {int(rank): links for rank, links in fetch.links_by_rank.items()}
+                scrape_statuses = {int(rank): status for rank, status in fetch.scrape_statuses.items()}
+                ingest_keyword_results(
+                    subscription.run,
+                    keyword_id,
+                    fetch.serp_results,
+                    links_by_rank,
+                    hit_count=fetch.hit_count,
+                    scrape_statuses=scrape_statuses,
+                )
+                # 取得を共有した実行にも、取り込んだ分のURL数・リンク数を数える
+                # (api_calls は実際に Google API を呼び出した実行にだけ数え、クォータの消費量と一致させる)
+                counters = {
+                    "urls_scraped": len(scrape_statuses),
+                    "urls_skipped": sum(1 for status in scrape_statuses.values() if status == "skipped"),
+                    "links_found": sum(len(links) for links in links_by_rank.values()),
+                }
+            subscription.delivered = True
+            subscription.save(update_fields=["delivered"])
+    except Exception as e:
+        print(f"Delivery failed (subscription={subscription_id}): {e}")
+        if KeywordFetchSubscription.objects.filter(id=subscription_id, delivered=False).update(delivered=True):
+            _record_keyword_outcome(run_id, keyword_id, succeeded=False)
+        return f"Error: {str(e)}"
 
-        if run.status == "pending":
-            run.status = "running"
-            run.save()
+    if counters:
+        incr_run_progress(run_id, **counters)
+    _record_keyword_outcome(run_id, keyword_id, succeeded=succeeded)
+    return f"Delivered: run={run_id} keyword={keyword_id}"
 
-        print(f"Task started: {keyword.text}")
 
-        # API検索実行
-        search_data = search_google(keyword.text, max_rank=run.max_rank)
+@shared_task
+def purge_keyword_fetches():
+    """
+    時間枠を過ぎて再利用されなくなった KeywordFetch (保存済みの検索結果・リンク) を削除する
+    """
+    threshold = timezone.now() - timedelta(seconds=settings.KEYWORD_FETCH_WINDOW * 2)
+    deleted, _ = KeywordFetch.objects.filter(started_at__lt=threshold, status__in=["completed", "failed"]).delete()
+    return f"Purged {deleted} keyword fetch rows"
 
-        if not search_data or not search_data["results"]:
-            print(f"Google search failed or no results for '{keyword.text}'")
-            dummy_site, _ = MediaSite.objects.get_or_create(domain="not_found", defaults={"name": "検索結果なし"})
 
-            SearchResult.objects.create(
-                run=run,
-                keyword=keyword,
-                media_site=dummy_site,
-                rank=0,
-                page_url="",
-                title="検索結果なし (API)",
-            )
-        else:
-            if search_data.get("hit_count"):
-                keyword.search_volume = search_data["hit_count"]
-                keyword.save()
-
-            results_list = search_data["results"]
-            print(f"Found {len(results_list)} results via API.")
-
-            for data in results_list:
-                parsed_url = urlparse(data["url"])
-                domain = parsed_url.netloc
-
-                media_site, _ = MediaSite.objects.get_or_create(domain=domain, defaults={"name": f"{domain}"})
-
-                search_result, created = SearchResult.objects.update_or_create(
-                    run=run,
-                    keyword=keyword,
-                    rank=data["rank"],
-                    defaults={
-                        "media_site": media_site,
-                        "page_url": data["url"],
-                        "title": data["title"],
-                    },
-                )
+def start_extraction_run(project, max_rank, force_refresh=False):
+    """
+    案件の全キーワードを対象に ExtractionRun を作成し、キーワードごとの抽出タスクを投入する。
+    キーワードが1件も無い場合は None を返す。
+    """
+    keyword_ids = list(project.keywords.values_list("id", flat=True))
+    if not keyword_ids:
+        return None
+
+    run = ExtractionRun.objects.create(
+        project=project,
+        status="pending",
+        max_rank=max_rank,
+        force_refresh=force_refresh,
+        total_keywords=len(keyword_ids),
+    )
+    init_run_progress(run, owner_id=project.owner_id)
+
+    # トランザクション内で呼ばれた場合も、コミット後にタスクを投入する (ワーカーから run が見えるように)
+    def enqueue():
+        for keyword_id in keyword_ids:
+            enqueue_extraction_for_keyword.delay(run.id, keyword_id)
+
+    transaction.on_commit(enqueue)
+    return run
+
 
-                # 指定順位までアフィリエイトリンク抽出
-                if data["rank"] <= run.max_rank:
-                    affiliate_links_data = extract_affiliate_links_from_url(data["url"])
-                    AffiliateLink.objects.filter(search_result=search_result).delete()
-                    for aff_data in affiliate_links_data:
-                        AffiliateLink.objects.create(
-                            search_result=search_result,
-                            link_url=aff_data["link_url"][:2000],
-                            asp_name=aff_data["asp_name"],
-                            product_name=aff_data["product_name"],
-                        )
-
-        # 完了判定
-        total_keywords_count = run.project.keywords.count()
-        processed_keywords_count = SearchResult.objects.filter(run=run).values("keyword").distinct().count()
-
-        if processed_keywords_count >= total_keywords_count:
-            run.status = "completed"
-            run.save()
-            print(f"Run {run_id} COMPLETED.")
-
-        return f"Success: {keyword.text}"
+@shared_task
+def dispatch_due_schedules():
+    """
+    celery beat から毎分実行され、実行日時を過ぎた定期スケジュールの抽出を開始する。
+    行ロック (SKIP LOCKED) を取るため、beat が重複して動いても同じスケジュールが二重に実行されることはない。
+    """
+    now = timezone.now()
+    started = 0
+    with transaction.atomic():
+        schedules = (
+            ExtractionSchedule.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("project", "last_run")
+            .filter(is_active=True, next_run_at__lte=now)
+        )
+        for schedule in schedules:
+            # 前回の実行がまだ終わっていない場合は今回分を見送る
+            if schedule.last_run and schedule.last_run.status in ExtractionRun.ACTIVE_STATUSES:
+                print(f"Schedule {schedule.id} skipped: run {schedule.last_run_id} is still active.")
+            else:
+                run = start_extraction_run(schedule.project, schedule.max_rank)
+                if run:
+                    schedule.last_run = run
+                    started += 1
+
+            schedule.next_run_at = next_run_at(schedule, after=now)
+            schedule.save(update_fields=["last_run", "next_run_at"])
+    return f"Dispatched {started} scheduled runs"
+
+
+@shared_task
+def build_excel_export(job_id):
+    """
+    Excelエクスポートジョブを実行し、生成ファイルを保存する
+    """
+    job = ExportJob.objects.select_related("project").get(id=job_id)
+    job.status = "running"
+    job.save(update_fields=["status"])
 
+    try:
+        write_excel(job.project, job)
+        job.status = "completed"
     except Exception as e:
-        print(f"Task failed: {e}")
-        return f"Error: {str(e)}"
+        print(f"Excel export failed (job={job_id}): {e}")
+        job.status = "failed"
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save()
+    return f"Export {job.status}: job={job_id}"
@@ -1,3 +1,661 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import httpx
+import openpyxl
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from affistant_core.celery import app
+from users.models import User
+
+from . import exports, http_client, rate_limit, redis_client, serp, tasks
+from .asp_matcher import AspMatcher
+from .authentication import token_cache_key
+from .events import issue_events_ticket, verify_events_ticket
+from .exports import EXPORT_HEADER, iter_csv, iter_rows
+from .host_health import HostHealth
+from .ingest import ingest_keyword_results
+from .link_parser import iter_anchors
+from .links import normalize_link_url, normalize_url
+from .models import (
+    AspRule,
+    ExtractionRun,
+    ExtractionSchedule,
+    ExportJob,
+    Keyword,
+    KeywordFetch,
+    PageCache,
+    Project,
+    SearchResult,
+)
+from .progress import get_run_progress, incr_run_progress, init_run_progress
+from .rate_limit import RateLimiter
+from .scheduling import next_run_at
+from .scraper import fetch_affiliate_links
+from .serializers import SearchResultSerializer
+from .singleflight import RunFetchRegistry
+from .tasks import start_extraction_run
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+A8_LINK = "https://px.a8.net/svt/ejp?a8mat=ABC123&utm_source=blog"
+A8_CANONICAL = "https://px.a8.net/svt/ejp?a8mat=ABC123"
+
+
+class FakeRedisMixin:
+    """
+    Redis (進捗・レートリミッター・サーキットブレーカー・取得の登録簿) をテストごとに fakeredis へ置き換える
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch.object(redis_client, "_client", self.redis))
+        self.enterContext(mock.patch.object(rate_limit, "_reserve", None))
+
+
+def _ingest(run, keyword, ranks, links=None):
+    ingest_keyword_results(
+        run,
+        keyword.id,
+        [
+            {"rank": rank, "title": f"{keyword.text} {rank}", "url": f"https://site{rank}.example/{keyword.text}"}
+            for rank in ranks
+        ],
+        {rank: links or [] for rank in ranks},
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SERP_PROVIDER="tracking.serp.FixtureSerpProvider", KEYWORD_FETCH_TIMEOUT=60)
+class ExtractionPipelineTests(FakeRedisMixin, TestCase):
+    """
+    SERP取得 → 記事スクレイピング (chord) → 取り込み → 終了状態への遷移
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email="pipeline@example.com")
+        self.project = Project.objects.create(name="pipeline", owner=self.user)
+        Keyword.objects.create(project=self.project, text="ワイヤレスイヤホン")
+        Keyword.objects.create(project=self.project, text="検索結果なし")
+
+        fixture_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(fixture_dir.cleanup)
+        self.fixture_path = os.path.join(fixture_dir.name, "serp.json")
+        items = [
+            {"title": "おすすめ", "link": "https://blog.example/earphones", "snippet": ""},
+            {"title": "比較", "link": "https://review.example/earphones", "snippet": ""},
+            {"title": "停止中", "link": "https://down.example/earphones", "snippet": ""},
+        ]
+        with open(self.fixture_path, "w", encoding="utf-8") as f:
+            json.dump({"ワイヤレスイヤホン": {"searchInformation": {"totalResults": "1200"}, "items": items}}, f)
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._serve))
+        self.enterContext(override_settings(SERP_FIXTURE_PATH=self.fixture_path))
+        self.enterContext(mock.patch.object(serp, "_provider", None))
+        self.enterContext(mock.patch.object(http_client, "get_async_client", return_value=client))
+
+        # Celery のタスク (chord を含む) をワーカーを使わずにその場で実行する
+        eager = {key: app.conf[key] for key in ("task_always_eager", "task_eager_propagates")}
+        app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.addCleanup(app.conf.update, eager)
+
+    def _serve(self, request):
+        if request.url.host == "down.example":
+            return httpx.Response(503)
+        html = f'<html><body><a href="{A8_LINK}">イヤホンA</a><a href="https://example.com/about">about</a></body></html>'
+        return httpx.Response(200, text=html, headers={"content-type": "text/html; charset=utf-8"})
+
+    def _start_run(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            run = start_extraction_run(self.project, max_rank=3)
+        run.refresh_from_db()
+        return run
+
+    def test_run_ingests_results_and_completes(self):
+        run = self._start_run()
+
+        self.assertEqual(run.status, "completed")
+        self.assertEqual((run.succeeded_keywords, run.failed_keywords), (2, 0))
+
+        results = SearchResult.objects.filter(run=run, keyword__text="ワイヤレスイヤホン").order_by("rank")
+        self.assertEqual([(r.rank, r.scrape_status) for r in results], [(1, "ok"), (2, "ok"), (3, "failed")])
+        links = [(link.link.url, link.asp_name) for r in results for link in r.affiliate_links.all()]
+        # ASPのホストのリンクも広告・解析用のパラメータは除いて保存する
+        self.assertEqual(links, [(A8_CANONICAL, "A8"), (A8_CANONICAL, "A8")])
+        self.assertEqual(results[0].summary.asp_list, "A8")
+
+        empty = SearchResult.objects.get(run=run, keyword__text="検索結果なし")
+        self.assertEqual(empty.rank, 0)
+
+    def test_shared_fetch_counts_urls_and_links_for_every_run(self):
+        other = Project.objects.create(name="other", owner=self.user)
+        Keyword.objects.create(project=other, text="ワイヤレスイヤホン")
+        leader = self._start_run()
+        with self.captureOnCommitCallbacks(execute=True):
+            follower = start_extraction_run(other, max_rank=3)
+
+        for run in (leader, follower):
+            progress = get_run_progress(run.id)
+            self.assertEqual((progress["urls_scraped"], progress["links_found"]), (3, 2))
+        self.assertEqual(get_run_progress(follower.id)["api_calls"], 0)
+
+    def test_run_fails_when_serp_provider_is_unavailable(self):
+        with override_settings(SERP_FIXTURE_PATH=""):
+            run = self._start_run()
+
+        self.assertEqual(run.status, "failed")
+        self.assertEqual(run.failed_keywords, 2)
+        self.assertFalse(SearchResult.objects.filter(run=run).exists())
+        # 失敗した取得は再利用されず、次の購読者が取り直す
+        self.assertEqual(set(KeywordFetch.objects.values_list("status", flat=True)), {"failed"})
+
+    def test_stale_fetch_is_failed_by_sweeper(self):
+        run = ExtractionRun.objects.create(project=self.project, max_rank=3, total_keywords=1, status="running")
+        fetch = KeywordFetch.objects.create(query="ワイヤレスイヤホン", max_rank=3, window_start=None)
+        fetch.subscriptions.create(run=run, keyword=self.project.keywords.first())
+
+        tasks.fail_stale_keyword_fetches()
+        self.assertEqual(ExtractionRun.objects.get(id=run.id).status, "running")
+
+        KeywordFetch.objects.filter(id=fetch.id).update(started_at=timezone.now() - timedelta(minutes=5))
+        tasks.fail_stale_keyword_fetches()
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.failed_keywords), ("failed", 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RunProgressTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email="progress@example.com")
+        project = Project.objects.create(name="progress", owner=self.user)
+        self.run = ExtractionRun.objects.create(project=project, status="running", total_keywords=4)
+        init_run_progress(self.run, self.user.id)
+        incr_run_progress(self.run.id, keywords_succeeded=1, links_found=3)
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse("run-progress", args=[self.run.id])
+
+    def _get(self, token):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def test_progress_is_served_from_redis_and_cached_token(self):
+        self.assertEqual(self._get(self.token).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self._get(self.token)
+
+        progress = response.json()
+        self.assertEqual((progress["status"], progress["total_keywords"]), ("running", 4))
+        self.assertEqual((progress["keywords_succeeded"], progress["links_found"]), (1, 3))
+        self.assertNotIn("owner_id", progress)
+        # キャッシュにはユーザー行 (パスワードハッシュ等) を載せない
+        self.assertEqual(cache.get(token_cache_key(self.token.key)), (self.user.id, True))
+
+    def test_other_users_and_deactivated_users_are_rejected(self):
+        other = Token.objects.create(user=User.objects.create(email="other@example.com"))
+        self.assertEqual(self._get(other).status_code, 404)
+
+        self.assertEqual(self._get(self.token).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._get(self.token).status_code, 401)
+
+
+class IncompleteSerpProvider(serp.SerpProvider):
+    pass
+
+
+class SerpProviderTests(SimpleTestCase):
+    def test_provider_without_search_fails_on_instantiation(self):
+        with self.assertRaises(TypeError):
+            IncompleteSerpProvider()
+
+        with override_settings(SERP_PROVIDER="tracking.tests.IncompleteSerpProvider"):
+            with mock.patch.object(serp, "_provider", None), self.assertRaises(TypeError):
+                serp.get_serp_provider()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PAGE_CACHE_TTL=60, SCRAPE_HOST_BURST=10)
+class PageCacheTests(FakeRedisMixin, TestCase):
+    """
+    記事ページのキャッシュ: TTL内の再利用、期限切れ後の条件付きリクエスト (304)、ASPルール変更時の無効化
+    """
+
+    url = "https://blog.example/earphones"
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.requests = []
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._serve))
+        self.enterContext(mock.patch.object(http_client, "get_async_client", return_value=client))
+
+    def _serve(self, request):
+        self.requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"etag": '"v1"'})
+        html = f'<html><body><a href="{A8_LINK}">イヤホンA</a></body></html>'
+        return httpx.Response(200, text=html, headers={"content-type": "text/html; charset=utf-8", "etag": '"v1"'})
+
+    def _fetch(self):
+        links_by_url, status_by_url = fetch_affiliate_links([self.url])
+        return [link["link_url"] for link in links_by_url[self.url]], status_by_url[self.url]
+
+    def test_fresh_page_is_reused_without_a_request(self):
+        self.assertEqual(self._fetch(), ([A8_CANONICAL], "ok"))
+        self.assertEqual(self._fetch(), ([A8_CANONICAL], "ok"))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_expired_page_is_revalidated_and_304_reuses_links(self):
+        self._fetch()
+        expired = timezone.now() - timedelta(seconds=120)
+        PageCache.objects.update(fetched_at=expired)
+
+        self.assertEqual(self._fetch(), ([A8_CANONICAL], "ok"))
+        self.assertEqual(self.requests[-1].headers["if-none-match"], '"v1"')
+        self.assertGreater(PageCache.objects.get().fetched_at, expired)
+        # 再検証で取得日時が更新されたため、次はリクエストせずに再利用する
+        self._fetch()
+        self.assertEqual(len(self.requests), 2)
+
+    def test_rules_change_discards_cached_extraction(self):
+        self._fetch()
+        AspRule.objects.create(name="テストASP", host="shop.example")
+
+        self.assertEqual(self._fetch(), ([A8_CANONICAL], "ok"))
+        self.assertEqual(len(self.requests), 2)
+        self.assertNotIn("if-none-match", self.requests[-1].headers)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, GOOGLE_CSE_RATE=1000)
+class SerpCacheTests(FakeRedisMixin, TestCase):
+    """
+    Custom Search API のページ単位のキャッシュと、実行に記録するヒット/ミス数
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.requests = []
+        self.total_results = 25
+        self.api_down = False
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._serve))
+        self.enterContext(mock.patch.object(http_client, "get_async_client", return_value=client))
+        self.provider = serp.GoogleCSEProvider(api_key="key", cse_id="cx")
+
+    def _serve(self, request):
+        self.requests.append(request)
+        if self.api_down:
+            return httpx.Response(500)
+        start = int(request.url.params["start"])
+        count = max(0, min(serp.PAGE_SIZE, self.total_results - start + 1))
+        items = [{"title": f"t{rank}", "link": f"https://site{rank}.example/"} for rank in range(start, start + count)]
+        data = {"searchInformation": {"totalResults": str(self.total_results)}, "items": items}
+        return httpx.Response(200, json=data)
+
+    def _counts(self, data):
+        return len(data["results"]), data["cache_hits"], data["cache_misses"]
+
+    def test_cached_pages_are_counted_as_hits(self):
+        self.assertEqual(self._counts(self.provider.search("kw", max_rank=30)), (25, 0, 3))
+        self.assertEqual(self._counts(self.provider.search("kw", max_rank=30)), (25, 3, 0))
+        self.assertEqual(len(self.requests), 3)
+
+        self.assertEqual(self._counts(self.provider.search("kw", max_rank=30, force_refresh=True)), (25, 0, 3))
+        self.assertEqual(len(self.requests), 6)
+
+    def test_pages_beyond_the_results_are_not_requested_or_counted(self):
+        self.total_results = 4
+        self.assertEqual(self._counts(self.provider.search("short", max_rank=30)), (4, 0, 1))
+        self.assertEqual([request.url.params["start"] for request in self.requests], ["1"])
+
+    def test_api_error_is_not_cached(self):
+        self.api_down = True
+        self.assertTrue(self.provider.search("kw", max_rank=10)["error"])
+
+        self.api_down = False
+        self.assertEqual(self._counts(self.provider.search("kw", max_rank=10)), (10, 0, 1))
+
+
+class RateLimiterTests(FakeRedisMixin, SimpleTestCase):
+    def test_gcra_allows_burst_then_spaces_requests(self):
+        limiter = RateLimiter("test", rate=10, burst=2)
+        waits = [limiter.reserve() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[2], 0.1, delta=0.02)
+        self.assertAlmostEqual(waits[3], 0.2, delta=0.02)
+
+    def test_buckets_are_independent(self):
+        RateLimiter("a", rate=1).reserve()
+        self.assertEqual(RateLimiter("b", rate=1).reserve(), 0)
+
+
+class RunFetchRegistryTests(FakeRedisMixin, SimpleTestCase):
+    def test_first_claim_owns_and_others_wait_for_published_result(self):
+        leader, follower = RunFetchRegistry(1), RunFetchRegistry(1)
+
+        self.assertEqual(leader.claim(["u1", "u2"]), (["u1", "u2"], {}, []))
+        self.assertEqual(follower.claim(["u1", "u2"]), ([], {}, ["u1", "u2"]))
+
+        leader.publish({"u1": ([{"link_url": A8_LINK}], "ok")})
+        self.assertEqual(follower.wait(["u1", "u2"], timeout=0), {"u1": ([{"link_url": A8_LINK}], "ok")})
+        self.assertEqual(follower.claim(["u1"]), ([], {"u1": ([{"link_url": A8_LINK}], "ok")}, []))
+
+    def test_released_claim_can_be_taken_over(self):
+        leader, follower = RunFetchRegistry(1), RunFetchRegistry(1)
+        leader.claim(["u1"])
+        leader.release(["u1"])
+
+        self.assertEqual(follower.claim(["u1"]), (["u1"], {}, []))
+        # 別の実行とは共有しない
+        self.assertEqual(RunFetchRegistry(2).claim(["u1"]), (["u1"], {}, []))
+
+
+@override_settings(
+    HOST_HEALTH_MIN_SAMPLES=2,
+    HOST_HEALTH_WINDOW=10,
+    HOST_FAILURE_THRESHOLD=0.5,
+    SCRAPE_MIN_TIMEOUT=3,
+    SCRAPE_TIMEOUT_P95_FACTOR=3,
+)
+class HostHealthTests(FakeRedisMixin, SimpleTestCase):
+    def _open_circuit(self, host):
+        health = HostHealth(host)
+        health.record(failed=True)
+        health.record(failed=True)
+        return health
+
+    def test_failures_open_the_circuit(self):
+        self.assertEqual(HostHealth("flaky.example").permit(15), 15)
+        self._open_circuit("flaky.example")
+        self.assertIsNone(HostHealth("flaky.example").permit(15))
+        self.assertEqual(HostHealth("other.example").permit(15), 15)
+
+    def test_half_open_probe_success_closes_the_circuit(self):
+        health = self._open_circuit("flaky.example")
+        self.redis.delete(health.open_key)  # クールダウン経過
+
+        probe = HostHealth("flaky.example")
+        self.assertEqual(probe.permit(15), 15)
+        # プローブ中は他のリクエストを通さない
+        self.assertIsNone(HostHealth("flaky.example").permit(15))
+
+        probe.record(latency=1.0)
+        self.assertEqual(HostHealth("flaky.example").permit(15), 15)
+
+    def test_half_open_probe_failure_reopens_the_circuit(self):
+        health = self._open_circuit("flaky.example")
+        self.redis.delete(health.open_key)
+
+        probe = HostHealth("flaky.example")
+        probe.permit(15)
+        probe.record(failed=True)
+        self.assertTrue(self.redis.exists(health.open_key))
+
+    def test_timeout_follows_p95_latency(self):
+        health = HostHealth("slow.example")
+        for _ in range(5):
+            health.record(latency=1.5)
+        self.assertEqual(HostHealth("slow.example").permit(15), 4.5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="export@example.com")
+        self.project = Project.objects.create(name="export", owner=self.user)
+        self.keywords = [Keyword.objects.create(project=self.project, text=text) for text in ("b", "a")]
+        self.runs = [ExtractionRun.objects.create(project=self.project, status="completed") for _ in range(2)]
+        for run in self.runs:
+            for keyword in self.keywords:
+                _ingest(run, keyword, [10, 2, 1])
+
+    def test_rows_follow_keyset_order_across_chunks(self):
+        # チャンクの境界がキーワードの途中に来るよう、1回の読み込み件数を小さくする
+        with mock.patch.object(exports, "QUERY_CHUNK_SIZE", 2):
+            rows = list(iter_rows(self.project))
+
+        expected = [(keyword, rank) for _ in self.runs for keyword in ("a", "b") for rank in (1, 2, 10)]
+        self.assertEqual([(row[1], row[3]) for row in rows], expected)
+        self.assertEqual(rows[0][5], "https://site1.example/a")
+
+    def test_filters_limit_runs_and_keywords(self):
+        rows = list(iter_rows(self.project, {"run": "latest", "keywords": ["b"]}))
+        self.assertEqual([(row[1], row[3]) for row in rows], [("b", 1), ("b", 2), ("b", 10)])
+
+        csv_text = "".join(iter_csv(self.project, {"run": str(self.runs[0].id)}))
+        self.assertTrue(csv_text.startswith("\ufeff検索日時,キーワード"))
+        self.assertEqual(len(csv_text.splitlines()), 1 + 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExcelExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="excel@example.com")
+        self.project = Project.objects.create(name="excel", owner=self.user)
+        keyword = Keyword.objects.create(project=self.project, text="kw")
+        _ingest(ExtractionRun.objects.create(project=self.project, status="completed"), keyword, [1, 2])
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        eager = {key: app.conf[key] for key in ("task_always_eager", "task_eager_propagates")}
+        app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.addCleanup(app.conf.update, eager)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("project-export-excel", args=[self.project.id])
+
+    def test_completed_job_is_reused_until_a_new_run_finishes(self):
+        first = self.client.post(self.url)
+        self.assertEqual(first.status_code, 202)
+        second = self.client.post(self.url)
+        self.assertEqual((second.status_code, second.json()["id"]), (200, first.json()["id"]))
+
+        ExtractionRun.objects.create(project=self.project, status="completed")
+        self.assertNotEqual(self.client.post(self.url).json()["id"], first.json()["id"])
+        self.assertEqual(ExportJob.objects.count(), 2)
+
+    def test_download_returns_the_generated_workbook(self):
+        job_id = self.client.post(self.url).json()["id"]
+        response = self.client.get(reverse("export-download", args=[job_id]))
+
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.values)
+        self.assertEqual(rows[0], tuple(EXPORT_HEADER))
+        self.assertEqual(len(rows), 1 + 2)
+
+        pending = ExportJob.objects.create(project=self.project)
+        self.assertEqual(self.client.get(reverse("export-download", args=[pending.id])).status_code, 409)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchResultListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="results@example.com")
+        project = Project.objects.create(name="results", owner=self.user)
+        keyword = Keyword.objects.create(project=project, text="kw")
+        self.run = ExtractionRun.objects.create(project=project, status="completed")
+        links = [
+            {"asp_name": "A8", "link_url": A8_LINK, "product_name": "商品A"},
+            {"asp_name": "もしも", "link_url": "https://af.moshimo.com/af/c/click?a_id=1", "product_name": "商品B"},
+        ]
+        _ingest(self.run, keyword, [1, 2, 3], links)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fast_path_matches_serializer_output(self):
+        response = self.client.get(reverse("result-list"), {"run": self.run.id})
+
+        queryset = SearchResult.objects.filter(run=self.run).order_by("-id").prefetch_related("affiliate_links__link")
+        expected = json.loads(JSONRenderer().render(SearchResultSerializer(queryset, many=True).data))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], expected)
+
+    def test_link_filter_uses_normalized_url(self):
+        url = "https://PX.A8.NET:443/svt/ejp?a8mat=ABC123&utm_source=blog#top"
+        response = self.client.get(reverse("result-list"), {"run": self.run.id, "link": url})
+        self.assertEqual(len(response.json()["results"]), 3)
+
+        url = "https://px.a8.net/svt/ejp?a8mat=ABC999&utm_source=blog"
+        response = self.client.get(reverse("result-list"), {"run": self.run.id, "link": url})
+        self.assertEqual(response.json()["results"], [])
+
+
+class DispatchDueSchedulesTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create(email="schedule@example.com")
+        self.project = Project.objects.create(name="schedule", owner=user)
+        Keyword.objects.create(project=self.project, text="kw")
+        self.past = timezone.now() - timedelta(minutes=1)
+
+    def _schedule(self, **fields):
+        fields = {"window_start": time(9, 0), "window_end": time(10, 0), "next_run_at": self.past, **fields}
+        return ExtractionSchedule.objects.create(project=self.project, **fields)
+
+    def test_due_active_schedules_start_a_run_and_move_to_the_next_window(self):
+        due = self._schedule(max_rank=5)
+        later = self._schedule(next_run_at=timezone.now() + timedelta(hours=1))
+        inactive = self._schedule(is_active=False)
+
+        tasks.dispatch_due_schedules()
+
+        due.refresh_from_db()
+        self.assertEqual((due.last_run.project, due.last_run.max_rank), (self.project, 5))
+        self.assertGreater(due.next_run_at, timezone.now())
+        for schedule in (later, inactive):
+            schedule.refresh_from_db()
+            self.assertIsNone(schedule.last_run)
+        self.assertEqual(ExtractionRun.objects.count(), 1)
+
+    def test_schedule_is_skipped_while_its_last_run_is_active(self):
+        active = ExtractionRun.objects.create(project=self.project, status="running")
+        schedule = self._schedule(last_run=active)
+
+        tasks.dispatch_due_schedules()
+
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.last_run, active)
+        self.assertGreater(schedule.next_run_at, timezone.now())
+        self.assertEqual(ExtractionRun.objects.count(), 1)
+
+
+class NextRunAtTests(SimpleTestCase):
+    def setUp(self):
+        tz = timezone.get_current_timezone()
+        self.at = lambda *args: timezone.make_aware(datetime(*args), tz)
+
+    def test_daily_window_crossing_midnight(self):
+        schedule = ExtractionSchedule(frequency="daily", window_start=time(23, 0), window_end=time(1, 0))
+        after = self.at(2026, 10, 17, 22, 0)
+
+        with mock.patch("tracking.scheduling.random.uniform", side_effect=lambda low, high: low):
+            self.assertEqual(next_run_at(schedule, after=after), self.at(2026, 10, 17, 23, 0))
+        with mock.patch("tracking.scheduling.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual(next_run_at(schedule, after=after), self.at(2026, 10, 18, 1, 0))
+
+        for _ in range(50):
+            run_at = next_run_at(schedule, after=after)
+            self.assertTrue(self.at(2026, 10, 17, 23, 0) <= run_at <= self.at(2026, 10, 18, 1, 0))
+
+    def test_window_already_started_moves_to_next_day(self):
+        schedule = ExtractionSchedule(frequency="daily", window_start=time(23, 0), window_end=time(1, 0))
+        with mock.patch("tracking.scheduling.random.uniform", side_effect=lambda low, high: low):
+            self.assertEqual(next_run_at(schedule, after=self.at(2026, 10, 17, 23, 30)), self.at(2026, 10, 18, 23, 0))
+
+    def test_weekly_window_crossing_midnight(self):
+        # 2026-10-17 は土曜日
+        schedule = ExtractionSchedule(frequency="weekly", weekday=5, window_start=time(23, 0), window_end=time(1, 0))
+        with mock.patch("tracking.scheduling.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual(next_run_at(schedule, after=self.at(2026, 10, 17, 23, 30)), self.at(2026, 10, 25, 1, 0))
+
+
+class AspRuleTests(SimpleTestCase):
+    def test_clean_rejects_invalid_patterns(self):
+        for pattern in ("(unclosed", "(?i)/aff"):
+            with self.assertRaises(ValidationError):
+                AspRule(name="bad", host="example.com", path_pattern=pattern).clean()
+        AspRule(name="ok", host="example.com", path_pattern="(?i:/aff)").clean()
+
+    def test_matcher_skips_invalid_rules(self):
+        matcher = AspMatcher(
+            [
+                AspRule(name="bad", host="example.com", path_pattern="(unclosed"),
+                AspRule(name="good", host="example.com", path_pattern="/click"),
+            ]
+        )
+        self.assertEqual(matcher.match("https://example.com/click?id=1"), "good")
+        self.assertIsNone(matcher.match("https://example.com/unclosed"))
+
+
+def _chunks(body, size=1000):
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+class LinkParserTests(SimpleTestCase):
+    def test_meta_charset_is_used_when_header_has_none(self):
+        html = '<html><head><meta charset="Shift_JIS"></head><body><a href="/a">商品名</a></body></html>'
+        anchors = list(iter_anchors(_chunks(html.encode("cp932"), size=7), content_type="text/html"))
+        self.assertEqual(anchors, [("/a", "商品名", None)])
+
+    def test_header_charset_takes_precedence_over_meta(self):
+        html = '<meta charset="Shift_JIS"><a href="/a">商品名</a>'
+        anchors = list(iter_anchors([html.encode("utf-8")], content_type="text/html; charset=UTF-8"))
+        self.assertEqual(anchors, [("/a", "商品名", None)])
+
+    def test_byte_cap_drops_markup_cut_mid_tag(self):
+        body = (
+            "<html><body>" + "x" * 5000 + '<a href="/1">一つ目</a><a href="/2">日本語<img src="p.png" alt="商品"></a>'
+        ).encode("utf-8")
+        content_type = "text/html; charset=utf-8"
+        capped = list(iter_anchors(_chunks(body), content_type=content_type, max_bytes=body.index(b"<img") + 4))
+        self.assertEqual(capped, [("/1", "一つ目", None)])
+
+        full = list(iter_anchors(_chunks(body), content_type=content_type))
+        self.assertEqual(full, [("/1", "一つ目", None), ("/2", "日本語", "商品")])
+
+
+class LinkNormalizationTests(SimpleTestCase):
+    def test_normalize_url_strips_only_requested_params(self):
+        url = "HTTPS://Example.com:443/a;jsessionid=XYZ?utm_source=x&sid=1&gclid=2&page=3#top"
+        self.assertEqual(normalize_url(url), "https://example.com/a;jsessionid=XYZ?utm_source=x&sid=1&gclid=2&page=3")
+        self.assertEqual(normalize_url(url, strip_tracking=True), "https://example.com/a;jsessionid=XYZ?sid=1&page=3")
+        self.assertEqual(normalize_url(url, strip_tracking=True, strip_session=True), "https://example.com/a?page=3")
+
+    def test_asp_links_drop_tracking_params_but_keep_generic_names(self):
+        matcher = AspMatcher([AspRule(name="ValueCommerce", host="valuecommerce.com")])
+        base = "https://ck.jp.ap.valuecommerce.com/servlet/referral?sid=111&pid=222"
+        for suffix in ("", "&utm_source=x", "&gclid=1", "&fbclid=2&_ga=3&mc_cid=4"):
+            self.assertEqual(normalize_link_url(base + suffix, matcher), base)
+        other = "https://other.example/?sid=1&utm_medium=x"
+        self.assertEqual(normalize_link_url(other, matcher), "https://other.example/")
+
+
+class EventsTicketTests(SimpleTestCase):
+    def test_ticket_is_bound_to_run(self):
+        ticket = issue_events_ticket(1, 10)
+        self.assertEqual(verify_events_ticket(ticket, 10), 1)
+        self.assertIsNone(verify_events_ticket(ticket, 11))
+        self.assertIsNone(verify_events_ticket(ticket + "x", 10))
+
+    @override_settings(RUN_EVENTS_TICKET_MAX_AGE=0)
+    def test_expired_ticket_is_rejected(self):
+        ticket = issue_events_ticket(1, 10)
+        with mock.patch("django.core.signing.time.time", return_value=datetime.now().timestamp() + 5):
+            self.assertIsNone(verify_events_ticket(ticket, 10))
@@ -1,11 +1,15 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from .views import (
     GenreViewSet,
     ProjectViewSet,
     KeywordViewSet,
     ExtractionRunViewSet,
+    ExtractionScheduleViewSet,
     SearchResultViewSet,
     MediaSiteViewSet,
+    ExportJobViewSet,
+    run_events,
 )
 
 router = DefaultRouter()
@@ -13,10 +17,15 @@ router.register(r"genres", GenreViewSet, basename="genre")
 router.register(r"projects", ProjectViewSet, basename="project")
 router.register(r"keywords", KeywordViewSet, basename="keyword")
 router.register(r"runs", ExtractionRunViewSet, basename="run")
+router.register(r"schedules", ExtractionScheduleViewSet, basename="schedule")
 router.register(r"results", SearchResultViewSet, basename="result")
 router.register(r"media", MediaSiteViewSet, basename="media")
+router.register(r"exports", ExportJobViewSet, basename="export")
 
 # app_name は DefaultRouter を使う場合は不要
 # app_name = 'tracking'
 
-urlpatterns = router.urls
+urlpatterns = [
+    # 抽出ジョブの進捗ストリーム (Server-Sent Events)
+    path("runs/<int:pk>/events/", run_events, name="run-events"),
+] + router.urls
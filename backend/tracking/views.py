@@ -1,21 +1,46 @@
-import csv
-import openpyxl
-from django.http import HttpResponse
-from django.utils import timezone
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Exists, OuterRef
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from urllib.parse import urlparse
-from .models import Genre, Project, Keyword, MediaSite, ExtractionRun, SearchResult
+from .asp_matcher import get_asp_matcher
+from .authentication import CachedTokenAuthentication
+from .events import issue_events_ticket, stream_run_events, verify_events_ticket
+from .exports import filter_runs, iter_csv, parse_export_filters
+from .links import link_hash, normalize_link_url
+from .models import (
+    Genre,
+    Project,
+    Keyword,
+    MediaSite,
+    ExtractionRun,
+    ExtractionSchedule,
+    SearchResult,
+    AffiliateLink,
+    ExportJob,
+)
+from .pagination import IdCursorPagination
+from .progress import get_run_progress
+from .scheduling import next_run_at
+from .renderers import ORJSONRenderer
 from .serializers import (
     GenreSerializer,
     ProjectSerializer,
     KeywordSerializer,
     MediaSiteSerializer,
     ExtractionRunSerializer,
+    ExtractionScheduleSerializer,
     SearchResultSerializer,
+    ExportJobSerializer,
+    SEARCH_RESULT_VALUE_FIELDS,
+    serialize_search_results_fast,
 )
-from .tasks import enqueue_extraction_for_keyword
+from .tasks import build_excel_export, start_extraction_run
+from users.models import User
 
 
 class BaseOwnerViewSet(viewsets.ModelViewSet):
@@ -42,150 +67,69 @@ class ProjectViewSet(BaseOwnerViewSet):
         project = self.get_object()
         raw_keywords = request.data.get("keywords", "")
         max_rank = request.data.get("max_rank", 10)
+        force_refresh = str(request.data.get("force_refresh", "")).lower() in ("1", "true", "yes")
 
         if raw_keywords:
             keyword_list = [k.strip() for k in raw_keywords.split("\n") if k.strip()]
             for k_text in keyword_list:
                 Keyword.objects.get_or_create(project=project, text=k_text)
 
-        keywords = project.keywords.all()
-        if not keywords.exists():
+        run = start_extraction_run(project, max_rank, force_refresh=force_refresh)
+        if run is None:
             return Response({"error": "キーワードが登録されていません。"}, status=status.HTTP_400_BAD_REQUEST)
 
-        run = ExtractionRun.objects.create(project=project, status="pending", max_rank=max_rank)
-        for keyword in keywords:
-            enqueue_extraction_for_keyword.delay(run.id, keyword.id)
-
         return Response(
             {
                 "run_id": run.id,
                 "status": run.status,
-                "task_count": keywords.count(),
-                "message": f"{keywords.count()}件のキーワードで検索を開始しました。",
+                "task_count": run.total_keywords,
+                "message": f"{run.total_keywords}件のキーワードで検索を開始しました。",
             },
             status=status.HTTP_202_ACCEPTED,
         )
 
-    # --- 共通のデータ行生成ロジック ---
-    def _generate_rows(self, project):
-        results = (
-            SearchResult.objects.filter(run__project=project)
-            .select_related("keyword", "run", "media_site")
-            .prefetch_related("affiliate_links")
-            .order_by("-run__executed_at", "keyword__text", "rank")
-        )
-
-        rows = []
-        for result in results:
-            display_rank = result.rank if result.rank > 0 else "取得失敗"
-
-            # メディア名: トップドメインのみ抽出
-            domain = result.media_site.domain
-            # "www." などを除去してきれいにする場合
-            if domain.startswith("www."):
-                domain = domain[4:]
-
-            # アフィリエイトリンク情報の整理
-            aff_links = result.affiliate_links.all()
-            has_affiliate = aff_links.exists()
-            media_type = "アフィリエイトメディア" if has_affiliate else "その他"
-
-            # 提携ASP一覧 (重複排除)
-            asp_set = set(link.asp_name for link in aff_links if link.asp_name)
-            asp_list_str = ", ".join(asp_set) if asp_set else ""
-
-            local_executed_at = timezone.localtime(result.run.executed_at)
-
-            # --- 修正: 月間検索ボリュームのカラムを削除 ---
-            row = [
-                local_executed_at.strftime("%Y-%m-%d %H:%M"),  # A: 検索日時
-                result.keyword.text,  # B: キーワード
-                # result.keyword.search_volume or 0,  # C: 月間検索ボリューム (削除)
-                domain,  # D: メディア名(トップドメイン)
-                display_rank,  # E: SEO順位
-                result.title,  # F: 記事名
-                result.page_url,  # G: 掲載記事リンク
-                media_type,  # H: メディア種類
-                asp_list_str,  # I: 提携ASP
-            ]
-
-            # リンク列 (トップ10まで)
-            for i in range(10):
-                if i < len(aff_links):
-                    row.append(aff_links[i].link_url)
-                else:
-                    row.append("")  # 空埋め
-
-            rows.append(row)
-        return rows
-
     # --- CSV出力 ---
     @action(detail=True, methods=["get"])
     def export_csv(self, request, pk=None):
         project = self.get_object()
+        try:
+            filters = parse_export_filters(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        response = HttpResponse(content_type="text/csv; charset=utf-8-sig")
+        # 行をチャンク単位で生成しながら送信する (全件をメモリに載せない)
+        response = StreamingHttpResponse(iter_csv(project, filters), content_type="text/csv; charset=utf-8")
         filename = f"{project.name}_seo_results.csv"
         response["Content-Disposition"] = f"attachment; filename=\"{filename}\"; filename*=UTF-8''{filename}"
-
-        writer = csv.writer(response)
-        # ヘッダー作成
-        # --- 修正: 月間検索ボリュームを削除 ---
-        header = [
-            "検索日時",
-            "キーワード",
-            # "月間検索ボリューム", (削除)
-            "メディア名",
-            "SEO順位",
-            "記事名",
-            "掲載記事リンク",
-            "メディア種類",
-            "提携ASP",
-        ]
-        # リンク1〜リンク10を追加
-        header.extend([f"リンク{i+1}" for i in range(10)])
-        writer.writerow(header)
-
-        rows = self._generate_rows(project)
-        for row in rows:
-            writer.writerow(row)
-
         return response
 
-    # --- Excel出力 ---
-    @action(detail=True, methods=["get"])
+    # --- Excel出力 (バックグラウンドジョブ) ---
+    @action(detail=True, methods=["post"])
     def export_excel(self, request, pk=None):
         project = self.get_object()
-
-        response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        filename = f"{project.name}_seo_results.xlsx"
-        response["Content-Disposition"] = f"attachment; filename=\"{filename}\"; filename*=UTF-8''{filename}"
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "SEO Results"
-
-        # --- 修正: 月間検索ボリュームを削除 ---
-        header = [
-            "検索日時",
-            "キーワード",
-            # "月間検索ボリューム", (削除)
-            "メディア名",
-            "SEO順位",
-            "記事名",
-            "掲載記事リンク",
-            "メディア種類",
-            "提携ASP",
-        ]
-        header.extend([f"リンク{i+1}" for i in range(10)])
-        ws.append(header)
-
-        rows = self._generate_rows(project)
-        for row in rows:
-            ws.append(row)
-
-        wb.save(response)
-        return response
+        try:
+            filters = parse_export_filters(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        latest_run = filter_runs(project, filters).first()
+
+        # 最新の実行が終了済みであれば、同じ (案件, 最新の実行, 範囲) のジョブ・生成ファイルを再利用する
+        job = None
+        if latest_run is None or latest_run.status not in ExtractionRun.ACTIVE_STATUSES:
+            job = (
+                project.export_jobs.filter(
+                    run=latest_run, filters=filters, status__in=["pending", "running", "completed"]
+                )
+                .order_by("-created_at")
+                .first()
+            )
+        if job is None:
+            job = ExportJob.objects.create(project=project, run=latest_run, filters=filters)
+            build_excel_export.delay(job.id)
+
+        serializer = ExportJobSerializer(job, context={"request": request})
+        response_status = status.HTTP_200_OK if job.status == "completed" else status.HTTP_202_ACCEPTED
+        return Response(serializer.data, status=response_status)
 
     @action(detail=True, methods=["post"])
     def clear_data(self, request, pk=None):
@@ -212,21 +156,172 @@ class MediaSiteViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "整数で指定してください。"})
+
+
 class ExtractionRunViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ExtractionRun.objects.all()
     serializer_class = ExtractionRunSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        return ExtractionRun.objects.filter(project__owner=user)
+        queryset = ExtractionRun.objects.filter(project__owner=user)
+
+        # 絞り込み: ?project=<id>&status=<status>
+        params = self.request.query_params
+        project_id = _int_param(params, "project")
+        if project_id is not None:
+            queryset = queryset.filter(project_id=project_id)
+        if params.get("status"):
+            queryset = queryset.filter(status=params["status"])
+        return queryset
+
+    @action(detail=True, methods=["post"], url_path="events-ticket")
+    def events_ticket(self, request, pk=None):
+        # 進捗ストリーム (SSE) への接続用の短期間のチケットを発行する
+        run = self.get_object()
+        return Response(
+            {"ticket": issue_events_ticket(request.user.id, run.id), "expires_in": settings.RUN_EVENTS_TICKET_MAX_AGE}
+        )
+
+    # --- 進捗 (Redis) ---
+    @action(detail=True, methods=["get"], authentication_classes=[CachedTokenAuthentication])
+    def progress(self, request, pk=None):
+        # 認証・所有者チェックを含め、DBには触れずタスクが Redis に書き込む進捗ハッシュだけを読む
+        progress = get_run_progress(pk)
+        if progress is None or progress.pop("owner_id") != request.user.id:
+            return Response({"error": "進捗情報が見つかりません。"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(progress)
+
+
+class ExtractionScheduleViewSet(viewsets.ModelViewSet):
+    queryset = ExtractionSchedule.objects.all()
+    serializer_class = ExtractionScheduleSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = ExtractionSchedule.objects.filter(project__owner=user)
+
+        # 絞り込み: ?project=<id>
+        project_id = _int_param(self.request.query_params, "project")
+        if project_id is not None:
+            queryset = queryset.filter(project_id=project_id)
+        return queryset
+
+    def _save_with_next_run(self, serializer):
+        # 頻度や時間帯の変更を反映して、次回実行日時を時間帯内のランダムな時刻に決め直す
+        schedule = serializer.save()
+        schedule.next_run_at = next_run_at(schedule) if schedule.is_active else None
+        schedule.save(update_fields=["next_run_at"])
+
+    def perform_create(self, serializer):
+        self._save_with_next_run(serializer)
+
+    def perform_update(self, serializer):
+        self._save_with_next_run(serializer)
 
 
 class SearchResultViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = SearchResult.objects.all()
     serializer_class = SearchResultSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        # 一覧は ModelSerializer を経由せず、.values() の行から同じ形のレスポンスを組み立てる (高速読み取りパス)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        page = self.paginate_queryset(queryset.values(*SEARCH_RESULT_VALUE_FIELDS))
+        return self.get_paginated_response(serialize_search_results_fast(list(page)))
 
     def get_queryset(self):
         user = self.request.user
-        return SearchResult.objects.filter(run__project__owner=user)
+        # シリアライザがネストして返す affiliate_links (とリンク本体) はまとめて取得する
+        queryset = SearchResult.objects.filter(run__project__owner=user).prefetch_related("affiliate_links__link")
+
+        # 絞り込み: ?run=&keyword=&media_site=&asp=&link=&rank_min=&rank_max=
+        params = self.request.query_params
+        for name in ("run", "keyword", "media_site"):
+            value = _int_param(params, name)
+            if value is not None:
+                queryset = queryset.filter(**{f"{name}_id": value})
+        rank_min = _int_param(params, "rank_min")
+        if rank_min is not None:
+            queryset = queryset.filter(rank__gte=rank_min)
+        rank_max = _int_param(params, "rank_max")
+        if rank_max is not None:
+            queryset = queryset.filter(rank__lte=rank_max)
+        if params.get("asp"):
+            queryset = queryset.filter(
+                Exists(AffiliateLink.objects.filter(search_result=OuterRef("pk"), asp_name=params["asp"]))
+            )
+        if params.get("link"):
+            # 保存時と同じ規則で正規化したURLのハッシュで CanonicalLink を引く
+            url_hash = link_hash(normalize_link_url(params["link"], get_asp_matcher()))
+            queryset = queryset.filter(
+                Exists(AffiliateLink.objects.filter(search_result=OuterRef("pk"), link__url_hash=url_hash))
+            )
+        return queryset
+
+
+class ExportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        return ExportJob.objects.filter(project__owner=user).select_related("project")
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != "completed" or not job.file:
+            return Response({"error": "ファイルはまだ生成されていません。"}, status=status.HTTP_409_CONFLICT)
+
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename=f"{job.project.name}_seo_results.xlsx",
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+
+
+async def _stream_user(request, run_id):
+    """
+    EventSource はヘッダーを付けられないため、events_ticket で発行した ?ticket=<チケット> で認証する
+    """
+    user_id = verify_events_ticket(request.GET.get("ticket", ""), run_id)
+    if user_id is None:
+        return None
+    return await User.objects.filter(id=user_id, is_active=True).afirst()
+
+
+async def run_events(request, pk):
+    """
+    抽出ジョブの進捗を Server-Sent Events で配信する (ASGI上で動作する非同期ビュー)。
+    ポーリングの代わりに、Celeryタスクが Redis pub/sub に送ったイベントをそのまま中継する。
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI 上では非同期イテレーターが最後まで読み込まれてから送信されるため、ストリームを配信できない
+        return HttpResponse("進捗ストリームは events サービス (ASGI) から配信されます。", status=status.HTTP_404_NOT_FOUND)
+    user = await _stream_user(request, pk)
+    if user is None:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    if not await ExtractionRun.objects.filter(id=pk, project__owner=user).aexists():
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(stream_run_events(pk), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx 等のリバースプロキシでのバッファリングを無効化
+    return response
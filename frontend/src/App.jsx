@@ -2,6 +2,8 @@ import React, { useState, useEffect, createContext, useContext, useMemo } from '
 
 // --- API通信 ---
 const API_BASE_URL = 'http://localhost:8000/api/v1';
+// 進捗ストリーム (SSE) は ASGI の events サービスから配信する
+const EVENTS_BASE_URL = 'http://localhost:8001/api/v1';
 
 const apiFetch = async (endpoint, token, options = {}) => {
   const headers = new Headers({
@@ -207,35 +209,66 @@ function ProjectDetail({ project, onBack }) {
   const [isExtracting, setIsExtracting] = useState(false);
   const [currentRunId, setCurrentRunId] = useState(null);
   const [runStatus, setRunStatus] = useState(null);
+  const [runProgress, setRunProgress] = useState(null);
   
   const [message, setMessage] = useState(null);
   const [error, setError] = useState(null);
 
   useEffect(() => {
     if (!currentRunId) return;
-    const checkStatus = async () => {
+    // 進捗はポーリングせず、サーバーからの push (Server-Sent Events) で受け取る。
+    // URLにAPIトークンを載せないよう、接続ごとに短期間の署名付きチケットを発行してもらう
+    let source = null;
+    let cancelled = false;
+    const connect = async () => {
+      let ticket;
       try {
-        const runData = await apiFetch(`/seo/runs/${currentRunId}/`);
-        setRunStatus(runData.status);
-        if (runData.status === 'completed') {
-          setMessage('検索が完了しました。CSVをダウンロードできます。');
-          setCurrentRunId(null);
-          setIsExtracting(false);
-        } else if (runData.status === 'failed') {
-          setError('検索処理中にエラーが発生しました。');
-          setCurrentRunId(null);
-          setIsExtracting(false);
+        ({ ticket } = await apiFetch(`/seo/runs/${currentRunId}/events-ticket/`, { method: 'POST' }));
+      } catch (err) {
+        console.error("Failed to get status stream ticket, retrying...", err);
+        if (!cancelled) setTimeout(connect, 3000);
+        return;
+      }
+      if (cancelled) return;
+      source = new EventSource(`${EVENTS_BASE_URL}/seo/runs/${currentRunId}/events/?ticket=${encodeURIComponent(ticket)}`);
+      source.addEventListener('status', handleEvent);
+      source.addEventListener('keyword', handleEvent);
+      source.onerror = () => {
+        // 一時的な切断は EventSource が自動で再接続する。チケットの期限切れなどで閉じられた場合は取り直す
+        if (source.readyState === EventSource.CLOSED && !cancelled) {
+          console.error("Status stream closed, reconnecting...");
+          setTimeout(connect, 3000);
         }
-      } catch (err) { console.error("Status check failed:", err); }
+      };
+    };
+    const handleEvent = (event) => {
+      const runData = JSON.parse(event.data);
+      setRunStatus(runData.status);
+      setRunProgress({ done: runData.succeeded_keywords + runData.failed_keywords, total: runData.total_keywords });
+      if (runData.status === 'completed') {
+        setMessage('検索が完了しました。CSVをダウンロードできます。');
+      } else if (runData.status === 'completed_with_errors') {
+        setMessage(`検索が完了しました (${runData.failed_keywords}件のキーワードでエラー)。CSVをダウンロードできます。`);
+      } else if (runData.status === 'failed') {
+        setError('検索処理中にエラーが発生しました。');
+      } else {
+        return;
+      }
+      cancelled = true;
+      source.close();
+      setCurrentRunId(null);
+      setIsExtracting(false);
     };
-    checkStatus();
-    const intervalId = setInterval(checkStatus, 3000);
-    return () => clearInterval(intervalId);
-  }, [currentRunId, apiFetch]);
+    connect();
+    return () => {
+      cancelled = true;
+      if (source) source.close();
+    };
+  }, [currentRunId, token]);
 
   const handleExtract = async () => {
     if (!keywords.trim()) { setError("キーワードを入力してください"); return; }
-    setIsExtracting(true); setMessage(null); setError(null); setRunStatus('pending');
+    setIsExtracting(true); setMessage(null); setError(null); setRunStatus('pending'); setRunProgress(null);
     try {
       const response = await apiFetch(`/seo/projects/${project.id}/extract/`, {
         method: 'POST',
@@ -269,7 +302,15 @@ function ProjectDetail({ project, onBack }) {
   const handleDownloadExcel = async () => {
     try {
       setError(null);
-      const response = await fetch(`${API_BASE_URL}/seo/projects/${project.id}/export_excel/`, {
+      // Excelはバックグラウンドで生成されるため、ジョブの完了を待ってからダウンロードする
+      let job = await apiFetch(`/seo/projects/${project.id}/export_excel/`, { method: 'POST' });
+      while (job.status === 'pending' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        job = await apiFetch(`/seo/exports/${job.id}/`);
+      }
+      if (job.status !== 'completed') throw new Error(job.error || 'ファイルの生成に失敗しました');
+
+      const response = await fetch(job.download_url, {
         method: 'GET',
         headers: { 'Authorization': `Token ${token}` },
       });
@@ -302,15 +343,19 @@ function ProjectDetail({ project, onBack }) {
           pending: "bg-yellow-50 text-yellow-700 border-yellow-200 ring-yellow-100",
           running: "bg-sky-50 text-sky-700 border-sky-200 ring-sky-100",
           completed: "bg-green-50 text-green-700 border-green-200 ring-green-100",
+          completed_with_errors: "bg-orange-50 text-orange-700 border-orange-200 ring-orange-100",
           failed: "bg-red-50 text-red-700 border-red-200 ring-red-100",
       };
-      const labels = { pending: "準備中...", running: "検索中", completed: "検索終了", failed: "失敗" };
+      const labels = { pending: "準備中...", running: "検索中", completed: "検索終了", completed_with_errors: "一部エラー", failed: "失敗" };
       return (
           <div className={`flex items-center space-x-2 px-3 py-1.5 rounded-full border ring-2 ring-offset-1 ${styles[runStatus] || styles.pending} shadow-sm`}>
               {(runStatus === 'pending' || runStatus === 'running') && (
                   <svg className="animate-spin h-4 w-4" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24"><circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4"></circle><path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path></svg>
               )}
               <span className="text-sm font-bold">{labels[runStatus] || runStatus}</span>
+              {runStatus === 'running' && runProgress && (
+                  <span className="text-xs font-semibold">{runProgress.done} / {runProgress.total}</span>
+              )}
           </div>
       );
   };